@@ -1,35 +1,21 @@
-import base64
-import uuid
-from io import BytesIO
+import json
 
-import jwt.exceptions
-import sqlalchemy.exc
-from PIL import Image
-from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt, get_jwt_identity
+from flask import Blueprint, Response, request, jsonify, send_from_directory
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 
-from db.db_operations import DatabaseOperations
+import services
+from http_cache import conditional
 
 blueprint = Blueprint('api', __name__, template_folder='templates')
-db = DatabaseOperations("db.sqlite")
-
-
-@blueprint.errorhandler(sqlalchemy.exc.SQLAlchemyError)
-def handle_db_error(error):
-    print(error, type(error))
-    return jsonify({"error": "Bad Request", "type": str(type(error))}), 400
-
-
-@blueprint.errorhandler(jwt.exceptions.ExpiredSignatureError)
-def handle_expired_error(error):
-    print(error, type(error))
-    return jsonify({"error": "Expired Signature"}), 401
 
 
 @blueprint.errorhandler(Exception)
 def handle_error(error: Exception):
     print(error, type(error))
-    return jsonify({"error": "Internal Server Error" if not str(error) else str(error), "type": str(type(error))}), 500
+    body, status = services.error_response(error)
+    if "retry_after" in body:
+        return jsonify(body), status, {"Retry-After": str(body["retry_after"])}
+    return jsonify(body), status
 
 
 @blueprint.route("/login", methods=["POST"])
@@ -38,20 +24,10 @@ def login():
         data = request.get_json()
     else:
         return jsonify({"error": "Unsupported Media Type"}), 415
-    username = data.get('username')
-    password = data.get('password')
-    user = db.get_user_by_username(username)
-    if db.check_user_password(username, password):
-        additional_claims = {"username": username, "admin": int(user.get("admin"))}
-        access_token = create_access_token(identity=str(user.get("id")), additional_claims=additional_claims,
-                                           fresh=True)
-        refresh_token = create_refresh_token(identity=str(user.get("id")), additional_claims=additional_claims)
-        return jsonify({
-            "access_token": access_token,
-            "refresh_token": refresh_token,
-        })
-    else:
-        return jsonify({"error": "Wrong login or password"}), 401
+    response = services.login(data.get('username'), data.get('password'), request.remote_addr)
+    if "error" in response:
+        return jsonify(response), 401
+    return jsonify(response)
 
 
 @blueprint.route("/register", methods=["POST"])
@@ -60,11 +36,7 @@ def register():
         data = request.get_json()
     else:
         return jsonify({"error": "Unsupported Media Type"}), 415
-    username = data.get("username")
-    password = data.get("password")
-    about = data.get("about")
-    user_id = db.create_user(username, password, about)
-    return jsonify({"success": "OK", "id": user_id})
+    return jsonify(services.register(data.get("username"), data.get("password"), data.get("about")))
 
 
 @blueprint.route("/recipes", methods=["POST"])
@@ -72,43 +44,32 @@ def register():
 def create_recipe():
     if request.is_json:
         data = request.get_json()
+    elif request.mimetype == "multipart/form-data":
+        data = recipe_form_data()
     else:
         return jsonify({"error": "Unsupported Media Type"}), 415
-    main_image = convert_to_image(data.get("main_image"))
-    main_image_filename = f"{current_app.config['UPLOAD_FOLDER']}{uuid.uuid4()}.jpg"
-    main_image.save(main_image_filename)
-
-    ingredients_list = []
-    for ingredient in data.get("ingredients"):
-        ingredients_list.append({
-            "name": ingredient.get("name"),
-            "amount": ingredient.get("amount"),
-            "unit": ingredient.get("unit")
-        })
-    recipe_parts_list = []
-    for part in data.get("recipe_parts"):
-        step_image_filename = None
-        if part.get("step_image"):
-            step_image = convert_to_image(part.get("step_image"))
-            step_image_filename = f"{current_app.config['UPLOAD_FOLDER']}{uuid.uuid4()}.jpg"
-            step_image.save(step_image_filename)
-
-        recipe_parts_list.append({
-            "text": part.get("text"),
-            "image": step_image_filename
-        })
-
-    user_id = get_jwt_identity()
-    recipe_id = db.create_recipe(
-        title=data.get("title"),
-        description=data.get("description"),
-        user_id=user_id,
-        tags=data.get("tags"),
-        image=main_image_filename,
-        ingredients=ingredients_list,
-        recipe_parts=recipe_parts_list
-    )
-    return jsonify({"success": "OK", "id": recipe_id})
+    return jsonify(services.create_recipe(data, get_jwt_identity()))
+
+
+def recipe_form_data():
+    # file parts are spooled to temporary files by the form parser and read from there
+    data = {
+        "title": request.form.get("title"),
+        "description": request.form.get("description"),
+        "tags": request.form.get("tags"),
+        "main_image": request.files.get("main_image"),
+        "ingredients": json.loads(request.form.get("ingredients", "[]")),
+        "recipe_parts": json.loads(request.form.get("recipe_parts", "[]")),
+    }
+    for i, part in enumerate(data["recipe_parts"]):
+        part["step_image"] = request.files.get(f"recipe_parts-{i}-step_image")
+    return data
+
+
+@blueprint.route("/uploads", methods=["POST"])
+@jwt_required()
+def create_upload():
+    return jsonify(services.create_upload())
 
 
 # @blueprint.route("/recipes/<int:recipe_id>", methods=["PUT"])
@@ -168,75 +129,90 @@ def create_recipe():
 
 @blueprint.route("/recipes", methods=["GET"])
 def get_recipes():
-    tags = request.args.get("tags", None)
-    title = request.args.get("title", None)
-    user_id = request.args.get("user_id", None)
-    page = request.args.get("page", 1, type=int)
-    recipes, pages = db.get_recipes(tags=tags, title=title, user_id=user_id, page=page)
-    if not recipes:
-        recipes = []
-
-    response = {"recipes": recipes}
-    if request.args.get("pages_info", None):
-        response["pages"] = pages
-    return jsonify(response)
+    return conditional(services.get_list_version("recipes"), lambda: jsonify(services.get_recipes(
+        tags=request.args.get("tags", None),
+        title=request.args.get("title", None),
+        user_id=request.args.get("user_id", None, type=int),
+        page=request.args.get("page", 1, type=int),
+        cursor=request.args.get("cursor", None),
+        pages_info=bool(request.args.get("pages_info", None))
+    )))
+
+
+@blueprint.route("/recipes/bulk", methods=["POST"])
+@jwt_required()
+def import_recipes():
+    if request.mimetype != "application/x-ndjson":
+        return jsonify({"error": "Unsupported Media Type"}), 415
+    # read line by line from the request body, never buffered as a whole
+    return jsonify(services.import_recipes(request.stream, get_jwt_identity()))
+
+
+@blueprint.route("/recipes/bulk", methods=["GET"])
+def export_recipes():
+    return Response(services.export_recipes(user_id=request.args.get("user_id", None, type=int)),
+                    mimetype="application/x-ndjson")
 
 
 @blueprint.route("/recipes/<int:recipe_id>", methods=["DELETE"])
 @jwt_required()
 def delete_recipe(recipe_id):
-    recipe = db.get_recipe_by_id(recipe_id)
-    if not recipe:
-        return jsonify({"error": "404 Not Found"})
-    elif int(get_jwt_identity()) != recipe.get("user").get("id") and not int(get_jwt().get("admin")):
-        return jsonify({"error": "403 Forbidden"})
-    else:
-        db.delete_recipe(recipe_id)
-        return jsonify({"success": "OK", "id": recipe_id})
+    return jsonify(services.delete_recipe(recipe_id, get_jwt_identity(), int(get_jwt().get("admin"))))
 
 
 @blueprint.route("/recipes/<int:recipe_id>", methods=["GET"])
 def get_recipe(recipe_id):
-    recipe = db.get_recipe_by_id(recipe_id=recipe_id)
-    return recipe if recipe else jsonify({"error": "404 Not Found"})
+    return conditional(services.get_recipe_version(recipe_id), lambda: jsonify(services.get_recipe(recipe_id)))
+
+
+@blueprint.route("/tags", methods=["GET"])
+def get_tags():
+    return jsonify(services.get_tags())
+
+
+@blueprint.route("/cache", methods=["GET"])
+@jwt_required()
+def get_cache_stats():
+    response = services.get_cache_stats(int(get_jwt().get("admin")))
+    if "error" in response:
+        return jsonify(response), 403
+    return jsonify(response)
+
+
+@blueprint.route("/profiles", methods=["GET"])
+@jwt_required()
+def get_profiles():
+    response = services.get_profiles(int(get_jwt().get("admin")))
+    if "error" in response:
+        return jsonify(response), 403
+    return jsonify(response)
+
+
+@blueprint.route("/profiles/<name>", methods=["GET"])
+@jwt_required()
+def get_profile(name):
+    if not int(get_jwt().get("admin")):
+        return jsonify({"error": "403 Forbidden"}), 403
+    if name not in services.profiler.names():
+        return jsonify({"error": "404 Not Found"}), 404
+    return send_from_directory(services.profiler.directory, name, as_attachment=True)
 
 
 @blueprint.route("/users", methods=["GET"])
 def get_users():
-    page = request.args.get("page", 1, type=int)
-    users, pages = db.get_users(page=page)
-    if not users:
-        users = []
-    response = {"users": users}
-
-    if request.args.get("pages_info", None):
-        response["pages"] = pages
-    return jsonify(response)
+    return jsonify(services.get_users(
+        page=request.args.get("page", 1, type=int),
+        cursor=request.args.get("cursor", None),
+        pages_info=bool(request.args.get("pages_info", None))
+    ))
 
 
 @blueprint.route("/users/<int:user_id>", methods=["GET"])
 def get_user(user_id):
-    user = db.get_user_by_id(user_id=user_id)
-    return user if user else jsonify({"error": "404 Not Found"})
-
-
-def convert_to_image(b64text):
-    try:
-        image_data = base64.b64decode(b64text)
-        img = Image.open(BytesIO(image_data))
-        img.verify()
-        img = Image.open(BytesIO(image_data))
-        if img.mode == 'RGBA':
-            img = img.convert('RGB')
-        return img
-    except Exception as _:
-        raise Exception("Invalid Image File")
+    return jsonify(services.get_user(user_id))
 
 
 @blueprint.route("/refresh")
 @jwt_required(refresh=True)
 def refresh():
-    token = get_jwt()
-    additional_claims = {"username": token.get("username"), "admin": token.get("admin")}
-    new_token = create_access_token(identity=token.get("sub"), additional_claims=additional_claims)
-    return jsonify({"access_token": new_token})
+    return jsonify(services.refresh(get_jwt()))
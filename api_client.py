@@ -0,0 +1,98 @@
+import json
+
+import requests
+from flask import request
+
+import services
+
+
+class LocalApiClient:
+    def _call(self, func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as error:
+            print(error, type(error))
+            return services.error_response(error)[0]
+
+    def login(self, username: str, password: str):
+        return self._call(services.login, username, password, request.remote_addr)
+
+    def register(self, username: str, password: str, about: str = None):
+        return self._call(services.register, username, password, about)
+
+    def create_recipe(self, data: dict, user_id: int):
+        return self._call(services.create_recipe, data, user_id)
+
+    def get_recipes(self, tags: str = None, title: str = None, user_id: int = None, page: int = 1,
+                    pages_info: bool = False):
+        return self._call(services.get_recipes, tags=tags, title=title, user_id=user_id, page=page,
+                          pages_info=pages_info)
+
+    def get_recipe(self, recipe_id: int):
+        return self._call(services.get_recipe, recipe_id)
+
+    def delete_recipe(self, recipe_id: int, user_id: int, admin: bool = False):
+        return self._call(services.delete_recipe, recipe_id, user_id, admin)
+
+    def get_user(self, user_id: int):
+        return self._call(services.get_user, user_id)
+
+    def get_recipe_version(self, recipe_id: int):
+        return services.get_recipe_version(recipe_id)
+
+    def get_list_version(self, *names: str):
+        return services.get_list_version(*names)
+
+
+class RemoteApiClient:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def login(self, username: str, password: str):
+        return requests.post(f"{self.base_url}/login", json={"username": username, "password": password}).json()
+
+    def register(self, username: str, password: str, about: str = None):
+        return requests.post(f"{self.base_url}/register",
+                             json={"username": username, "password": password, "about": about}).json()
+
+    def create_recipe(self, data: dict, user_id: int):
+        fields = {
+            "title": data.get("title"),
+            "description": data.get("description"),
+            "tags": data.get("tags"),
+            "ingredients": json.dumps(data.get("ingredients")),
+            "recipe_parts": json.dumps([{"text": part.get("text")} for part in data.get("recipe_parts")]),
+        }
+        files = {"main_image": data.get("main_image")}
+        for i, part in enumerate(data.get("recipe_parts")):
+            files[f"recipe_parts-{i}-step_image"] = part.get("step_image")
+        files = {name: (file.filename, file.stream, file.mimetype) for name, file in files.items() if file}
+        return requests.post(f"{self.base_url}/recipes", cookies=request.cookies, data=fields, files=files).json()
+
+    def get_recipes(self, tags: str = None, title: str = None, user_id: int = None, page: int = 1,
+                    pages_info: bool = False):
+        params = {"page": page, "tags": tags, "title": title, "user_id": user_id,
+                  "pages_info": "true" if pages_info else None}
+        return requests.get(f"{self.base_url}/recipes", params=params).json()
+
+    def get_recipe(self, recipe_id: int):
+        return requests.get(f"{self.base_url}/recipes/{recipe_id}").json()
+
+    def delete_recipe(self, recipe_id: int, user_id: int, admin: bool = False):
+        return requests.delete(f"{self.base_url}/recipes/{recipe_id}", cookies=request.cookies).json()
+
+    def get_user(self, user_id: int):
+        return requests.get(f"{self.base_url}/users/{user_id}").json()
+
+    # pages rendered from a remote API are not validated locally
+    def get_recipe_version(self, recipe_id: int):
+        return None
+
+    def get_list_version(self, *names: str):
+        return None
+
+
+def create_api_client(config):
+    if config.get("API_MODE") == "remote":
+        return RemoteApiClient(config["API_URL"])
+    return LocalApiClient()
@@ -0,0 +1,184 @@
+import re
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags, parse_date, http_date as format_http_date
+
+import main
+import metrics
+import services
+from db.async_operations import AsyncDatabaseOperations
+from http_cache import make_etag, http_date
+
+# Run with an ASGI server, e.g. `uvicorn asgi:application --workers 4`.
+# The read-only API endpoints are served natively on the event loop with the async database engine;
+# everything else (pages, uploads, sign-in) goes through the Flask app in asgiref's thread pool.
+app = main.create_app()
+db = AsyncDatabaseOperations(services.db)
+db.init_app(app)
+
+
+async def get_recipes(args):
+    version = services.list_version_response(("recipes",), await db.call("get_data_versions", "recipes"))
+
+    async def build():
+        pages_info = bool(args.get("pages_info", None))
+        return services.recipes_response(*await db.call(
+            "get_recipes",
+            tags=args.get("tags", None),
+            title=args.get("title", None),
+            user_id=args.get("user_id", None, type=int),
+            page=args.get("page", 1, type=int),
+            cursor=args.get("cursor", None),
+            pages_info=pages_info
+        ), pages_info)
+    return version, build
+
+
+async def get_recipe(args, recipe_id):
+    version = services.recipe_version_response(recipe_id, await db.call("get_recipe_version", recipe_id))
+
+    async def build():
+        recipe = await db.call("get_recipe_by_id", recipe_id)
+        return recipe if recipe else {"error": "404 Not Found"}
+    return version, build
+
+
+async def get_tags(args):
+    async def build():
+        return {"tags": await db.call("get_tags")}
+    return None, build
+
+
+async def get_users(args):
+    async def build():
+        pages_info = bool(args.get("pages_info", None))
+        return services.users_response(*await db.call(
+            "get_users",
+            page=args.get("page", 1, type=int),
+            cursor=args.get("cursor", None),
+            pages_info=pages_info
+        ), pages_info)
+    return None, build
+
+
+async def get_user(args, user_id):
+    async def build():
+        user = await db.call("get_user_by_id", user_id)
+        return user if user else {"error": "404 Not Found"}
+    return None, build
+
+
+ROUTES = [
+    (re.compile(r"/api/recipes"), get_recipes),
+    (re.compile(r"/api/recipes/(\d+)"), get_recipe),
+    (re.compile(r"/api/tags"), get_tags),
+    (re.compile(r"/api/users"), get_users),
+    (re.compile(r"/api/users/(\d+)"), get_user),
+]
+
+
+def match(path: str):
+    for pattern, handler in ROUTES:
+        found = pattern.fullmatch(path)
+        if found:
+            return handler, [int(group) for group in found.groups()]
+    return None, None
+
+
+def is_not_modified(headers: dict, etag: str, last_modified) -> bool:
+    # the same rules as http_cache.is_not_modified
+    if headers.get("if-none-match"):
+        return parse_etags(headers["if-none-match"]).contains_weak(etag)
+    if last_modified and headers.get("if-modified-since"):
+        since = parse_date(headers["if-modified-since"])
+        return since is not None and last_modified <= since
+    return False
+
+
+async def respond(send, status: int, body: bytes = b"", headers=(), head: bool = False):
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+               *((name.encode(), value.encode()) for name, value in headers)]
+    if status == 304:
+        headers = headers[2:]
+        body = b""
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": b"" if head else body})
+
+
+def dumps(data) -> bytes:
+    # what jsonify() would send
+    return (app.json.dumps(data, separators=(",", ":")) + "\n").encode()
+
+
+async def handle(scope, send, handler, params):
+    query = scope["query_string"].decode("latin-1")
+    args = MultiDict(parse_qs(query, keep_blank_values=True))
+    headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+    head = scope["method"] == "HEAD"
+    try:
+        version, build = await handler(args, *params)
+        if version is None:
+            return await respond(send, 200, dumps(await build()), head=head)
+
+        etag = make_etag(f"{scope['path']}?{query}", version["version"])
+        last_modified = http_date(version["last_modified"])
+        cache_headers = [("etag", f'"{etag}"')]
+        if last_modified:
+            cache_headers.append(("last-modified", format_http_date(last_modified)))
+        cache_headers.append(("cache-control",
+                              f"public, max-age={app.config['HTTP_CACHE_MAX_AGE']}, must-revalidate"))
+        if is_not_modified(headers, etag, last_modified):
+            return await respond(send, 304, headers=cache_headers, head=head)
+        await respond(send, 200, dumps(await build()), cache_headers, head=head)
+    except Exception as error:
+        print(error, type(error))
+        body, status = services.error_response(error)
+        await respond(send, status, dumps(body), head=head)
+
+
+class AsyncApi:
+    def __init__(self, wsgi_app):
+        self.fallback = WsgiToAsgi(wsgi_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            handler, params = match(scope["path"])
+            if handler:
+                return await self.measure(scope, send, handler, params)
+        await self.fallback(scope, receive, send)
+
+    async def measure(self, scope, send, handler, params):
+        # the same request metrics as the Flask views, under the same endpoint names
+        if not app.config["METRICS_ENABLED"]:
+            return await handle(scope, send, handler, params)
+        stats = metrics.begin(f"api.{handler.__name__}")
+        status = 500
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await handle(scope, send_and_record, handler, params)
+        finally:
+            query = scope["query_string"].decode("latin-1")
+            metrics.finish(stats, scope["method"], status, f"{scope['path']}?{query}" if query else scope["path"])
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await db.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+application = AsyncApi(app)
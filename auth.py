@@ -0,0 +1,103 @@
+import heapq
+import threading
+import time
+
+from flask import request, current_app
+from flask_jwt_extended import decode_token, get_jwt, set_access_cookies
+
+import services
+
+
+class MemoryDenylist:
+    # revoked token ids until the tokens would have expired anyway; per process
+    def __init__(self):
+        self._revoked = {}
+        self._expiry = []
+        self._lock = threading.Lock()
+
+    def add(self, jti: str, expires: float):
+        with self._lock:
+            now = time.time()
+            while self._expiry and self._expiry[0][0] < now:
+                self._revoked.pop(heapq.heappop(self._expiry)[1], None)
+            if expires > now:
+                self._revoked[jti] = expires
+                heapq.heappush(self._expiry, (expires, jti))
+
+    def contains(self, jti: str) -> bool:
+        with self._lock:
+            return self._revoked.get(jti, 0) >= time.time()
+
+
+class RedisDenylist:
+    # shared by every process, the keys expire with the tokens
+    def __init__(self, client=None, url: str = None, prefix: str = "cookbook:revoked:"):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def add(self, jti: str, expires: float):
+        ttl = int(expires - time.time()) + 1
+        if ttl > 0:
+            self.client.set(self.prefix + jti, 1, ex=ttl)
+
+    def contains(self, jti: str) -> bool:
+        return bool(self.client.exists(self.prefix + jti))
+
+
+def create_denylist(config):
+    if config.get("JWT_DENYLIST_TYPE", "memory") == "redis":
+        return RedisDenylist(url=config["CACHE_REDIS_URL"])
+    return MemoryDenylist()
+
+
+denylist = MemoryDenylist()
+
+
+def init_app(app, jwt):
+    global denylist
+    denylist = create_denylist(app.config)
+    jwt.token_in_blocklist_loader(is_revoked)
+    app.after_request(renew_access_token)
+
+
+def is_revoked(jwt_header, jwt_payload: dict) -> bool:
+    return denylist.contains(jwt_payload["jti"])
+
+
+def revoke(token: dict):
+    denylist.add(token["jti"], token["exp"])
+
+
+def revoke_cookies():
+    # signing out revokes both tokens, expired ones included
+    for name in (current_app.config["JWT_ACCESS_COOKIE_NAME"], current_app.config["JWT_REFRESH_COOKIE_NAME"]):
+        try:
+            revoke(decode_token(request.cookies[name], allow_expired=True))
+        except Exception:
+            pass
+
+
+def refresh_from_cookie():
+    # a new access token from the refresh token cookie, or None when it is missing, expired or revoked
+    try:
+        token = decode_token(request.cookies[current_app.config["JWT_REFRESH_COOKIE_NAME"]])
+    except Exception:
+        return None
+    if token.get("type") != "refresh" or is_revoked(None, token):
+        return None
+    return services.refresh(token)["access_token"]
+
+
+def renew_access_token(response):
+    # access tokens close to expiry are replaced on any response, so active users never see them expire
+    try:
+        token = get_jwt()
+    except RuntimeError:
+        return response
+    if token.get("type") == "access" and token["exp"] - time.time() < current_app.config["JWT_RENEW_WINDOW"]:
+        set_access_cookies(response, services.refresh(token)["access_token"])
+    return response
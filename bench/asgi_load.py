@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, seed, free_port, wait_for
+
+PATHS = ["/api/recipes", "/api/recipes?page=2", "/api/recipes/1", "/api/tags", "/api/users"]
+SERVERS = {
+    "sync": [sys.executable, "-c", "import main; main.create_app().run(port={port}, threaded=True)"],
+    "gunicorn": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", "127.0.0.1:{port}",
+                 "--backlog", "2048"],
+    "asgi": [sys.executable, "-m", "uvicorn", "asgi:application", "--port", "{port}", "--log-level", "warning",
+             "--backlog", "2048"],
+}
+REQUIREMENTS = {
+    "gunicorn": ("gunicorn",),
+    "asgi": ("asgiref", "uvicorn", "aiosqlite"),
+}
+
+
+async def get(port: int, path: str) -> int:
+    # one connection per request, so both servers do the same work regardless of keep-alive support
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+        return int(response.split(b" ", 2)[1])
+    finally:
+        writer.close()
+
+
+async def load(port: int, clients: int, duration: float):
+    latencies = []
+    errors = {}
+    stop = time.perf_counter() + duration
+
+    async def client(number: int):
+        i = number
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                status = await get(port, PATHS[i % len(PATHS)])
+                if status != 200:
+                    raise ValueError(f"HTTP {status}")
+                latencies.append(time.perf_counter() - start)
+            except Exception as error:
+                key = str(error) or type(error).__name__
+                errors[key] = errors.get(key, 0) + 1
+            i += 1
+
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    latencies.sort()
+    return {
+        "requests/s": round(len(latencies) / duration, 1),
+        "p50 ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p99 ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1) if latencies else None,
+        "errors": errors,
+    }
+
+
+def run(mode: str, database: str, clients: int, duration: float):
+    port = free_port()
+    command = [part.format(port=port) for part in SERVERS[mode]]
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{database}"}
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port)
+        asyncio.run(load(port, clients, 1))  # warm up the caches and the connection pools
+        return asyncio.run(load(port, clients, duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test of the read-only API endpoints with many concurrent clients: requests/s of the "
+                    "threaded Flask server (sync), gunicorn with gunicorn.conf.py (WEB_WORKERS, WEB_THREADS) "
+                    "and uvicorn serving asgi.py (asgi)")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--modes", nargs="+", choices=SERVERS, default=list(SERVERS))
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from db.db_operations import DatabaseOperations
+
+    database = os.path.join(tempfile.mkdtemp(), "db.sqlite")
+    seed(DatabaseOperations(database), 200)
+    for mode in args.modes:
+        missing = [name for name in REQUIREMENTS.get(mode, ()) if importlib.util.find_spec(name) is None]
+        if missing:
+            print(f"{mode:<10}skipped, not installed: {', '.join(missing)}")
+            continue
+        print(f"{mode:<10}{json.dumps(run(mode, database, args.clients, args.duration), ensure_ascii=False)}")
+
+
+if __name__ == '__main__':
+    main()
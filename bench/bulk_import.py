@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, seed
+
+MODES = ("create_recipe", "import_recipes")
+
+
+def recipes(count: int):
+    for i in range(count):
+        yield {
+            "title": f"Рецепт {i}",
+            "description": "Описание рецепта",
+            "tags": f"тег{i % 20}, бенчмарк",
+            "ingredients": [{"name": f"ингредиент {j}", "amount": 100, "unit": "GRAM"} for j in range(5)],
+            "recipe_parts": [{"text": f"Шаг {j}"} for j in range(4)],
+        }
+
+
+def run(mode: str, count: int, chunk_size: int):
+    sys.path.insert(0, ROOT)
+    os.chdir(tempfile.mkdtemp())
+
+    from db.db_operations import DatabaseOperations
+
+    db = DatabaseOperations("db.sqlite")
+    user_id = seed(db)
+
+    start = time.perf_counter()
+    if mode == "create_recipe":
+        for recipe in recipes(count):
+            db.create_recipe(user_id=user_id, **recipe)
+    else:
+        db.import_recipes(recipes(count), user_id, chunk_size)
+    seconds = time.perf_counter() - start
+
+    export_start = time.perf_counter()
+    exported = sum(1 for _ in db.iter_recipes(chunk_size=chunk_size))
+    export_seconds = time.perf_counter() - export_start
+    print(json.dumps({"recipes/s": round(count / seconds, 1), "seconds": round(seconds, 2),
+                      "export recipes/s": round(exported / export_seconds, 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recipes/s of one create_recipe() call per recipe against the chunked bulk import, "
+                    "and of the streamed export")
+    parser.add_argument("--recipes", type=int, default=5000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.recipes, args.chunk_size)
+        return
+
+    for mode in MODES:
+        # a fresh process and database per mode
+        output = subprocess.run([sys.executable, __file__, "--mode", mode, "--recipes", str(args.recipes),
+                                 "--chunk-size", str(args.chunk_size)],
+                                capture_output=True, text=True, check=True).stdout
+        print(f"{mode:<16}{output.strip()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import os
+import random
+import socket
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERNAME = "bench"
+PASSWORD = "bench-password"
+# every recipe has a main image; without real uploads the recipes point at a missing file, as in the other benchmarks
+PLACEHOLDER_IMAGE = "static/uploads/bench.jpg"
+
+
+def seed(db, recipes: int = 0, ingredients: int = 1, parts: int = 1) -> int:
+    # the "bench" user with numbered recipes through DatabaseOperations; returns the user id
+    user_id = db.create_user(USERNAME, PASSWORD)
+    for i in range(recipes):
+        db.create_recipe(title=f"Рецепт {i}", description=f"Описание {i}", user_id=user_id,
+                         tags=f"тег{i % 3}, тег{i % 2}", image=PLACEHOLDER_IMAGE,
+                         ingredients=[{"name": f"ингредиент {j}", "amount": 100, "unit": "GRAM"}
+                                      for j in range(ingredients)],
+                         recipe_parts=[{"text": f"Шаг {j}"} for j in range(parts)])
+    return user_id
+
+
+def photo(rnd: random.Random, width: int = 1200, height: int = 900) -> bytes:
+    # a noisy JPEG compresses about like a photo
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (width // 8, height // 8), rnd.randbytes(width // 8 * height // 8 * 3))
+    buffer = BytesIO()
+    image.resize((width, height)).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port: int, timeout: float = 30):
+    stop = time.perf_counter() + timeout
+    while time.perf_counter() < stop:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"server on port {port} did not start")
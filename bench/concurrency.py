@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from common import ROOT, seed
+
+MODES = {
+    "default": {"pragmas": {}},
+    "tuned": {},
+}
+
+
+def run(mode: str, readers: int, writers: int, duration: float):
+    sys.path.insert(0, ROOT)
+    os.chdir(tempfile.mkdtemp())
+
+    from db.db_operations import DatabaseOperations
+
+    db = DatabaseOperations("db.sqlite", **MODES[mode])
+    user_id = seed(db, 100)
+
+    counters = {"reads": 0, "writes": 0, "errors": 0}
+    errors = {}
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def worker(operation, counter):
+        while time.perf_counter() < stop:
+            try:
+                operation()
+                key = counter
+            except Exception as error:
+                key = "errors"
+                with lock:
+                    errors[str(error).splitlines()[0]] = errors.get(str(error).splitlines()[0], 0) + 1
+            with lock:
+                counters[key] += 1
+
+    def write():
+        db.create_recipe(title="Новый рецепт", description="Описание", user_id=user_id, tags="тег, новое",
+                         ingredients=[{"name": "мука", "amount": 100, "unit": "GRAM"}],
+                         recipe_parts=[{"text": "Смешать"}])
+
+    def read():
+        db.get_recipes(pages_info=True)
+
+    threads = [threading.Thread(target=worker, args=(read, "reads")) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=(write, "writes")) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counters.update({f"{key}/s": round(counters[key] / duration, 1) for key in ("reads", "writes")})
+    counters["error_types"] = errors
+    print(json.dumps(counters, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent read/write load test of the SQLite engine settings")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.readers, args.writers, args.duration)
+        return
+
+    for mode in MODES:
+        # every mode gets its own process: the engine is configured once per process
+        output = subprocess.run([sys.executable, __file__, "--mode", mode, "--readers", str(args.readers),
+                                 "--writers", str(args.writers), "--duration", str(args.duration)],
+                                capture_output=True, text=True, check=True).stdout
+        print(f"{mode:<10}{output.strip()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import json
+import random
+import sys
+import time
+
+from common import ROOT, PASSWORD, PLACEHOLDER_IMAGE
+
+# generated users get a cheap hash, a real one per user would take most of the run;
+# signing in rehashes it with the configured method
+FAST_HASH_METHOD = "pbkdf2:sha256:1"
+
+DISHES = ["суп", "борщ", "салат", "пирог", "каша", "паста", "рагу", "котлеты", "блины", "оладьи", "торт", "запеканка",
+          "плов", "омлет", "гуляш", "пельмени", "вареники", "шарлотка", "сырники", "жаркое", "щи", "солянка"]
+FEATURES = ["с грибами", "с курицей", "с говядиной", "с рыбой", "с сыром", "с овощами", "с яблоками", "с творогом",
+            "по-домашнему", "острый", "постный", "быстрый", "бабушкин", "праздничный", "летний", "с томатами"]
+# most recipes carry the first few tags
+TAGS = ["обед", "ужин", "завтрак", "быстро", "выпечка", "десерт", "суп", "вегетарианское", "праздник", "курица",
+        "мясо", "рыба", "детское", "постное", "закуска", "салат", "гарнир", "соус", "напитки", "заготовки",
+        "мультиварка", "духовка", "гриль", "кухня народов мира", "низкокалорийное"]
+INGREDIENTS = [
+    ("мука", "GRAM", 50, 500), ("сахар", "GRAM", 10, 250), ("соль", "TEASPOON", 0.25, 2), ("яйцо", "PIECE", 1, 6),
+    ("молоко", "MILLILITER", 50, 1000), ("сливочное масло", "GRAM", 10, 200),
+    ("растительное масло", "TABLESPOON", 1, 5), ("лук", "PIECE", 1, 3), ("чеснок", "PIECE", 1, 5),
+    ("морковь", "PIECE", 1, 3), ("картофель", "GRAM", 200, 1500),
+    ("курица", "GRAM", 300, 1500), ("говядина", "GRAM", 300, 1500), ("рыба", "GRAM", 300, 1000),
+    ("сыр", "GRAM", 50, 300), ("творог", "GRAM", 200, 800), ("сметана", "TABLESPOON", 1, 6), ("томаты", "PIECE", 1, 6),
+    ("грибы", "GRAM", 100, 600), ("рис", "CUP", 0.5, 3), ("гречка", "CUP", 0.5, 3), ("вода", "LITER", 0.2, 3),
+    ("перец", "TEASPOON", 0.25, 1), ("зелень", "GRAM", 10, 50), ("яблоки", "KILOGRAM", 0.5, 2),
+    ("капуста", "GRAM", 200, 1000), ("свекла", "PIECE", 1, 3), ("разрыхлитель", "TEASPOON", 0.5, 2),
+]
+STEPS = ["Нарезать", "Обжарить", "Смешать", "Добавить", "Варить", "Запекать", "Взбить", "Посолить", "Остудить",
+         "Выложить", "Тушить", "Подавать"]
+WORDS = ["очень", "вкусно", "просто", "сытно", "нежно", "ароматно", "рецепт", "семья", "гости", "дети", "ужин",
+         "выходные", "традиционный", "сезон", "соус", "хрустящий", "сочный", "минут", "духовка", "сковорода"]
+
+
+def zipf_weights(count: int, exponent: float = 1.1) -> list:
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def clamp(value: float, low: int, high: int) -> int:
+    return max(low, min(high, round(value)))
+
+
+def recipe(rnd: random.Random, images: list = (PLACEHOLDER_IMAGE,)) -> dict:
+    # recipe in the import/API format; sizes follow what people actually post: a handful of tags and
+    # ingredients, most descriptions short and a few long
+    tags = set(rnd.choices(TAGS, zipf_weights(len(TAGS)), k=clamp(rnd.gauss(2.5, 1), 1, 5)))
+    ingredients = rnd.sample(INGREDIENTS, clamp(rnd.gauss(8, 3), 2, min(20, len(INGREDIENTS))))
+    return {
+        "title": f"{rnd.choice(DISHES).capitalize()} {rnd.choice(FEATURES)}",
+        "description": " ".join(rnd.choices(WORDS, k=clamp(rnd.lognormvariate(3, 0.8), 3, 400))),
+        "tags": ", ".join(sorted(tags)),
+        "image": rnd.choice(images),
+        "ingredients": [{"name": name, "amount": round(rnd.uniform(low, high), 1), "unit": unit}
+                        for name, unit, low, high in ingredients],
+        "recipe_parts": [{"text": f"{rnd.choice(STEPS)} {' '.join(rnd.choices(WORDS, k=rnd.randint(4, 25)))}."}
+                         for _ in range(clamp(rnd.gauss(6, 2.5), 2, 15))],
+    }
+
+
+def generate(db, users: int, recipes: int, seed: int = 0, images: list = (PLACEHOLDER_IMAGE,),
+             chunk_size: int = 500) -> dict:
+    # users with Zipf-distributed recipe counts (a few prolific authors, a long tail with one or two),
+    # all through DatabaseOperations; the same seed gives the same data
+    from db.db_session import create_session
+    from db.models.recipe import Recipe
+    from passwords import hasher
+
+    rnd = random.Random(seed)
+    start = time.perf_counter()
+    settings = hasher.method, hasher.workers, hasher.queue
+    hasher.configure(FAST_HASH_METHOD)
+    try:
+        user_ids = [db.create_user(f"user{i}", PASSWORD, about=" ".join(rnd.choices(WORDS, k=rnd.randint(0, 15))))
+                    for i in range(users)]
+    finally:
+        hasher.configure(*settings)
+
+    authors = rnd.choices(range(users), zipf_weights(users), k=recipes)
+    counts = [authors.count(i) for i in range(users)]
+    for user_id, count in zip(user_ids, counts):
+        if count:
+            db.import_recipes((recipe(rnd, images) for _ in range(count)), user_id, chunk_size)
+
+    with create_session(readonly=True) as session:
+        recipe_ids = [row[0] for row in session.query(Recipe.id).order_by(Recipe.id)]
+    return {
+        "users": user_ids,
+        "recipes": recipe_ids,
+        "recipes_per_user": counts,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fill a new database with generated users and recipes (the same seed gives the same data)")
+    parser.add_argument("database", help="path of the SQLite file or a database URL")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--recipes", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+
+    from db.db_operations import DatabaseOperations
+
+    data = generate(DatabaseOperations(args.database), args.users, args.recipes, args.seed)
+    print(json.dumps({"users": len(data["users"]), "recipes": len(data["recipes"]),
+                      "most recipes per user": max(data["recipes_per_user"]), "seconds": data["seconds"]}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import base64
+import glob
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from common import ROOT
+
+# name: (size, format, EXIF orientation)
+CORPUS = {
+    "jpeg-small": ((800, 600), "JPEG", None),
+    "jpeg-12mp": ((4000, 3000), "JPEG", None),
+    "jpeg-12mp-rotated": ((4000, 3000), "JPEG", 6),
+    "png-3mp": ((2000, 1500), "PNG", None),
+    "webp-small": ((1200, 800), "WEBP", None),
+}
+
+
+def make_corpus(folder: str):
+    for name, (size, format, orientation) in CORPUS.items():
+        # a gradient with noise compresses roughly like a photo
+        noise = Image.effect_noise(size, 40)
+        gradient = Image.linear_gradient("L").resize(size)
+        image = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+        options = {}
+        if orientation:
+            exif = Image.Exif()
+            exif[0x0112] = orientation
+            options["exif"] = exif
+        image.save(os.path.join(folder, f"{name}.{format.lower()}"), format, **options)
+
+
+def legacy(path: str, workdir: str):
+    # base64 JSON, verify, open again, full-size JPEG re-encode inside the request
+    b64text = base64.b64encode(open(path, "rb").read())
+    image_data = base64.b64decode(b64text)
+    img = Image.open(BytesIO(image_data))
+    img.verify()
+    img = Image.open(BytesIO(image_data))
+    if img.mode == 'RGBA':
+        img = img.convert('RGB')
+    img.save(os.path.join(workdir, "legacy.jpg"))
+
+
+def previous_pipeline(path: str, workdir: str):
+    # verify, then a full-resolution decode for the variants, every output re-encoded
+    import images
+
+    with Image.open(path) as image:
+        image.verify()
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        target = os.path.join(workdir, "previous.jpg")
+        for variant, (width, quality) in images.VARIANTS.items():
+            if image.width > width:
+                image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            if variant == "full":
+                full = image
+            images.save_atomic(image, images.variant_path(target, variant), "WEBP", quality=quality, method=4)
+        images.save_atomic(full, target, "JPEG", quality=images.JPEG_QUALITY, optimize=True, progressive=True)
+
+
+def validation_only(path: str, workdir: str):
+    import images
+
+    images.validate(path)
+
+
+def current_pipeline(path: str, workdir: str):
+    import images
+
+    upload = os.path.join(workdir, "current.upload")
+    shutil.copyfile(path, upload)
+    images.validate(upload)
+    images.process(upload, os.path.join(workdir, "current.jpg"))
+
+
+STAGES = {
+    "legacy": legacy,
+    "previous": previous_pipeline,
+    "validate": validation_only,
+    "current": current_pipeline,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time image validation and processing per image: the original request-time path, "
+                    "the verify + full decode pipeline, the header-only validation and the current pipeline")
+    parser.add_argument("--corpus", help="folder with sample images (default: a generated corpus)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+
+    corpus = args.corpus
+    if not corpus:
+        corpus = tempfile.mkdtemp()
+        make_corpus(corpus)
+    workdir = tempfile.mkdtemp()
+
+    print(f"{'image':<24}" + "".join(f"{stage + ' ms':>14}" for stage in STAGES))
+    for path in sorted(glob.glob(os.path.join(corpus, "*"))):
+        timings = []
+        for stage in STAGES.values():
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                stage(path, workdir)
+                samples.append((time.perf_counter() - start) * 1000)
+            timings.append(statistics.median(samples))
+        print(f"{os.path.basename(path):<24}" + "".join(f"{timing:>14.1f}" for timing in timings))
+
+
+if __name__ == '__main__':
+    main()
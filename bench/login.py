@@ -0,0 +1,141 @@
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from common import ROOT
+
+METHODS = ["pbkdf2:sha256:600000", "scrypt:16384:8:1", "scrypt:32768:8:1", "argon2:3:65536:4"]
+# the limits as they were before (none) and the defaults from main.py
+SETTINGS = {
+    "unlimited": {"LOGIN_RATE_USERNAME": "1000000/1", "LOGIN_RATE_IP": "1000000/1", "PASSWORD_HASH_WORKERS": 0},
+    "limited": {"LOGIN_RATE_USERNAME": "10/300", "LOGIN_RATE_IP": "30/60", "PASSWORD_HASH_WORKERS": 2},
+}
+
+
+def hash_cost(methods: list, rounds: int):
+    from passwords import PasswordHasher
+
+    for method in methods:
+        if method.startswith("argon2") and importlib.util.find_spec("argon2") is None:
+            print(f"{method:<24}skipped, not installed: argon2-cffi")
+            continue
+        hasher = PasswordHasher(method)
+        password_hash = hasher.hash("bench-password")
+        times = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            hasher.verify(password_hash, "bench-password")
+            times.append(time.perf_counter() - start)
+        print(f"{method:<24}verify {statistics.median(times) * 1000:.1f} ms")
+
+
+def configure(app, settings: dict):
+    import services
+
+    app.config.update(settings)
+    services.hasher.init_app(app)
+    # fresh buckets for every run
+    services.limiter.init_app(app)
+
+
+def login(client, username: str, password: str, ip: str):
+    start = time.perf_counter()
+    response = client.post("/api/login", json={"username": username, "password": password},
+                           environ_base={"REMOTE_ADDR": ip})
+    return response.status_code, time.perf_counter() - start
+
+
+def burst(app, attempts: int, threads: int, ips: int):
+    # credential stuffing: wrong passwords for a list of names from a few addresses, while a user who is not
+    # on the list signs in from their own address every 100 ms
+    results = {"attempts": attempts, "hashed": 0, "429": 0}
+    lock = threading.Lock()
+    done = threading.Event()
+    legit = []
+
+    def attacker(worker: int):
+        client = app.test_client()
+        for i in range(worker, attempts, threads):
+            username = f"user{i % 100}"
+            status, _ = login(client, username, f"guess{i}", f"10.0.0.{i % ips}")
+            with lock:
+                results["429" if status == 429 else "hashed"] += 1
+
+    def user():
+        client = app.test_client()
+        while not done.is_set():
+            status, seconds = login(client, "victim", "bench-password", "192.168.0.1")
+            legit.append((status, seconds))
+            time.sleep(0.1)
+
+    workers = [threading.Thread(target=attacker, args=(i,)) for i in range(threads)]
+    watcher = threading.Thread(target=user)
+    cpu, start = time.process_time(), time.perf_counter()
+    watcher.start()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    done.set()
+    watcher.join()
+    results["seconds"] = round(time.perf_counter() - start, 2)
+    results["cpu seconds"] = round(time.process_time() - cpu, 2)
+    latencies = [seconds for status, seconds in legit if status == 200]
+    results["user logins"] = f"{len(latencies)}/{len(legit)}"
+    if latencies:
+        results["user p50 ms"] = round(statistics.median(latencies) * 1000, 1)
+        results["user max ms"] = round(max(latencies) * 1000, 1)
+    return results
+
+
+def rehash(app):
+    # a password stored with an older method is rehashed with the configured one on sign-in
+    import services
+
+    configure(app, {**SETTINGS["unlimited"], "PASSWORD_HASH_METHOD": "pbkdf2:sha256:600000"})
+    services.db.create_user("rehash", "bench-password")
+    before = services.db.get_user_credentials("rehash")["password"].split("$", 1)[0]
+    configure(app, {**SETTINGS["unlimited"], "PASSWORD_HASH_METHOD": "scrypt:32768:8:1"})
+    status, _ = login(app.test_client(), "rehash", "bench-password", "127.0.0.1")
+    after = services.db.get_user_credentials("rehash")["password"].split("$", 1)[0]
+    status_again, _ = login(app.test_client(), "rehash", "bench-password", "127.0.0.1")
+    print(f"rehash    {before} -> {after}, logins {status} {status_again}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Password hashing cost per method, a credential stuffing burst against /api/login with and "
+                    "without rate limits, and rehashing of old hashes on sign-in")
+    parser.add_argument("--attempts", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ips", type=int, default=4, help="addresses the attempts come from")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--methods", nargs="+", default=METHODS)
+    parser.add_argument("--settings", nargs="+", choices=SETTINGS, default=list(SETTINGS))
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+    os.chdir(tempfile.mkdtemp())
+
+    hash_cost(args.methods, args.rounds)
+
+    import main as cookbook
+    import services
+
+    app = cookbook.create_app({"DATABASE_URL": "sqlite:///db.sqlite"})
+    services.db.create_user("victim", "bench-password")
+    for i in range(0, 100, 2):
+        services.db.create_user(f"user{i}", "bench-password")
+    for name in args.settings:
+        configure(app, SETTINGS[name])
+        print(f"{name:<10}{json.dumps(burst(app, args.attempts, args.threads, args.ips), ensure_ascii=False)}")
+    rehash(app)
+
+
+if __name__ == '__main__':
+    main()
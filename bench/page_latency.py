@@ -0,0 +1,59 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from common import ROOT, seed
+
+PAGES = ["/", "/recipes/1", "/users/1", "/search?title=Рецепт&tags=тег1"]
+
+
+def measure(client, requests_per_page: int):
+    results = {}
+    for page in PAGES:
+        start = time.perf_counter()
+        for _ in range(requests_per_page):
+            client.get(page)
+        results[page] = (time.perf_counter() - start) / requests_per_page * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Page latency: in-process API calls vs HTTP loopback")
+    parser.add_argument("--recipes", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.chdir(tempfile.mkdtemp())
+
+    import main as cookbook
+    from api_client import LocalApiClient, RemoteApiClient
+
+    app = cookbook.create_app()
+    seed(cookbook.api.services.db, args.recipes)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", args.port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = app.test_client()
+    app.extensions["api_client"] = RemoteApiClient(f"http://127.0.0.1:{args.port}/api")
+    remote = measure(client, args.requests)
+    app.extensions["api_client"] = LocalApiClient()
+    local = measure(client, args.requests)
+    server.shutdown()
+
+    print(f"{'page':<40}{'remote, ms':>12}{'local, ms':>12}{'speedup':>10}")
+    for page in PAGES:
+        print(f"{page:<40}{remote[page]:>12.2f}{local[page]:>12.2f}{remote[page] / local[page]:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
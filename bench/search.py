@@ -0,0 +1,87 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from common import ROOT, seed
+
+WORDS = ["суп", "салат", "пирог", "борщ", "каша", "паста", "рагу", "котлеты", "блины", "торт",
+         "курица", "говядина", "рыба", "грибы", "сыр", "картофель", "фасоль", "томаты", "лук", "чеснок"]
+TAGS = ["завтрак", "обед", "ужин", "десерт", "выпечка", "вегетарианское", "соль", "фасоль", "быстро", "праздник"]
+QUERIES = [("суп", None), ("пирог грибы", None), (None, "десерт"), (None, "соль, обед"), ("паста", "ужин")]
+
+
+def insert_recipes(user_id: int, recipes: int):
+    # plain multi-row INSERTs, a hundred thousand create_recipe() calls would take most of the run
+    import sqlalchemy as sa
+
+    from db.db_session import create_session
+    from db.models.recipe import Recipe
+
+    rnd = random.Random(42)
+    with create_session() as session:
+        batch = []
+        for i in range(recipes):
+            batch.append({
+                "title": " ".join(rnd.sample(WORDS, 3)).capitalize(),
+                "description": " ".join([rnd.choice(WORDS)] + [f"слово{rnd.randrange(5000)}" for _ in range(20)]),
+                "tags": ", ".join(rnd.sample(TAGS, 2)),
+                "user_id": user_id,
+            })
+            if len(batch) == 10000:
+                session.execute(sa.insert(Recipe), batch)
+                batch = []
+        if batch:
+            session.execute(sa.insert(Recipe), batch)
+        session.commit()
+
+
+def legacy_search(title, tags):
+    from db.db_session import create_session
+    from db.models.recipe import Recipe
+
+    with create_session() as session:
+        query = session.query(Recipe)
+        if title:
+            query = query.filter(Recipe.title.ilike(f"%{title}%"))
+        if tags:
+            for tag in tags.split(','):
+                query = query.filter(Recipe.tags.ilike(f"%{tag.strip()}%"))
+        total_pages = (query.count() + 9) // 10
+        return query.order_by(Recipe.created_date.desc()).limit(10).all(), total_pages
+
+
+def timed(func, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe search: FTS5 index vs ILIKE scan")
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.chdir(tempfile.mkdtemp())
+
+    from db.db_operations import DatabaseOperations
+
+    db = DatabaseOperations("db.sqlite")
+    start = time.perf_counter()
+    insert_recipes(seed(db), args.recipes)
+    print(f"seeded {args.recipes} recipes in {time.perf_counter() - start:.1f}s")
+
+    print(f"{'title':<15}{'tags':<15}{'ilike, ms':>12}{'fts, ms':>12}")
+    for title, tags in QUERIES:
+        legacy = timed(lambda: legacy_search(title, tags), args.repeat)
+        fts = timed(lambda: db.get_recipes(title=title, tags=tags, pages_info=True), args.repeat)
+        print(f"{title or '':<15}{tags or '':<15}{legacy:>12.2f}{fts:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import base64
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from common import ROOT, PASSWORD, photo
+
+# a slower median or more SQL statements per request than the baseline by this much is a regression;
+# the statement counts are exact, the timings only as stable as the machine they ran on
+THRESHOLD = 0.25
+SEARCHES = [{"title": "суп"}, {"title": "пирог с яблоками"}, {"title": "котлеты"}, {"tags": "десерт"},
+            {"tags": "обед, быстро"}, {"title": "паста", "tags": "ужин"}, {"title": "запеканка творог"}]
+
+
+def upload_images(count: int, rnd: random.Random) -> list:
+    # real uploads through the storage, so pages link existing variants
+    import images
+    import services
+
+    keys = [services.save_image(BytesIO(photo(rnd))) for _ in range(count)]
+    images.pipeline.wait()
+    return keys
+
+
+class Context:
+    def __init__(self, app, data: dict, seed: int):
+        from generate import zipf_weights
+
+        self.app = app
+        self.client = app.test_client()
+        self.rnd = random.Random(seed)
+        self.data = data
+        self.user_weights = zipf_weights(len(data["users"]))
+        self.photo = base64.b64encode(photo(self.rnd)).decode()
+
+    def user_id(self) -> int:
+        # profiles are visited about as often as their authors post
+        return self.rnd.choices(self.data["users"], self.user_weights)[0]
+
+    def sign_in(self):
+        from flask_jwt_extended import create_access_token
+
+        with self.app.app_context():
+            token = create_access_token(str(self.data["users"][0]), additional_claims={"username": "user0", "admin": 0})
+        self.client.set_cookie("access_token_cookie", token)
+
+
+def feed(ctx: Context):
+    return ctx.client.get(f"/?page={ctx.rnd.choice([1, 1, 1, 2, 3, 5, 10])}")
+
+
+def search(ctx: Context):
+    return ctx.client.get("/search", query_string=ctx.rnd.choice(SEARCHES))
+
+
+def recipe(ctx: Context):
+    return ctx.client.get(f"/recipes/{ctx.rnd.choice(ctx.data['recipes'])}")
+
+
+def profile(ctx: Context):
+    return ctx.client.get(f"/users/{ctx.user_id()}")
+
+
+def login(ctx: Context):
+    # always the same user: the first sign-in (in the warmup) replaces the generator's cheap hash
+    return ctx.client.post("/api/login", json={"username": "user0", "password": PASSWORD})
+
+
+def create_recipe(ctx: Context):
+    from generate import recipe as generate_recipe
+
+    return ctx.client.post("/api/recipes", json={**generate_recipe(ctx.rnd), "main_image": ctx.photo})
+
+
+# name: (scenario, share of --iterations; signing in is slow by design)
+SCENARIOS = {
+    "feed": (feed, 1),
+    "search": (search, 1),
+    "recipe": (recipe, 1),
+    "profile": (profile, 1),
+    "login": (login, 0.1),
+    "create_recipe": (create_recipe, 0.5),
+}
+
+
+def percentile(values: list, share: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def run(ctx: Context, scenario, iterations: int, warmup: int) -> dict:
+    import images
+    from db import db_session
+
+    statements = []
+    db_session.query_listeners.append(lambda statement, seconds: statements.append(seconds))
+    try:
+        for _ in range(warmup):
+            scenario(ctx)
+        latencies, queries, errors = [], [], 0
+        for _ in range(iterations):
+            statements.clear()
+            start = time.perf_counter()
+            response = scenario(ctx)
+            latencies.append(time.perf_counter() - start)
+            queries.append(len(statements))
+            errors += response.status_code >= 400 or "error" in (response.get_json(silent=True) or {})
+            # uploads are processed in the background; not part of the request, but not left to slow the next one
+            images.pipeline.wait()
+    finally:
+        db_session.query_listeners.pop()
+    return {"latencies": latencies, "queries": queries, "errors": errors}
+
+
+def summary(samples: dict) -> dict:
+    latencies = sorted(samples["latencies"])
+    return {
+        "iterations": len(latencies),
+        "errors": samples["errors"],
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "ops_per_second": round(len(latencies) / sum(latencies), 1),
+        "queries_per_request": round(statistics.mean(samples["queries"]), 2),
+    }
+
+
+def git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    print(f"{'scenario':<16}{'p50 ms':>10}{'baseline':>10}{'change':>9}{'queries':>9}{'baseline':>10}")
+    for name, current in results["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if not previous:
+            continue
+        change = current["p50_ms"] / previous["p50_ms"] - 1
+        slower = change > threshold
+        more_queries = current["queries_per_request"] > previous["queries_per_request"] * (1 + threshold)
+        if slower or more_queries:
+            regressions.append(name)
+        print(f"{name:<16}{current['p50_ms']:>10.2f}{previous['p50_ms']:>10.2f}{change:>+9.0%}"
+              f"{current['queries_per_request']:>9.2f}{previous['queries_per_request']:>10.2f}"
+              f"{'  REGRESSION' if slower or more_queries else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the feed, search, recipe, profile, sign-in and recipe creation on generated data; "
+                    "results are written as JSON and can be compared with an earlier run")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--recipes", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--images", type=int, default=20, help="distinct uploaded images the recipes share")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=4,
+                        help="the iterations are split into rounds over all scenarios, so a slow spell of the "
+                             "machine is spread over all of them")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--cache", choices=["none", "lru"], default="none",
+                        help="application cache; none measures the database on every request")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    os.chdir(tempfile.mkdtemp())
+
+    import main as cookbook
+    import services
+    from generate import generate
+
+    app = cookbook.create_app({"DATABASE_URL": "sqlite:///db.sqlite", "CACHE_TYPE": args.cache,
+                               "LOGIN_RATE_USERNAME": "1000000/1", "LOGIN_RATE_IP": "1000000/1"})
+    data = generate(services.db, args.users, args.recipes, args.seed,
+                    images=upload_images(args.images, random.Random(args.seed)))
+    print(f"generated {len(data['users'])} users and {len(data['recipes'])} recipes in {data['seconds']} s")
+
+    ctx = Context(app, data, args.seed)
+    ctx.sign_in()
+    results = {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parameters": {name: value for name, value in vars(args).items()
+                       if name not in ("output", "baseline", "threshold")},
+        "scenarios": {},
+    }
+    samples = {name: {"latencies": [], "queries": [], "errors": 0} for name in args.scenarios}
+    for round_number in range(args.rounds):
+        for name in args.scenarios:
+            scenario, share = SCENARIOS[name]
+            iterations = max(1, round(args.iterations * share / args.rounds))
+            warmup = max(1, round(args.warmup * share)) if round_number == 0 else 0
+            for key, value in run(ctx, scenario, iterations, warmup).items():
+                samples[name][key] += value
+    for name in args.scenarios:
+        result = results["scenarios"][name] = summary(samples[name])
+        print(f"{name:<16}{json.dumps(result)}")
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
+    if baseline:
+        with open(baseline) as file:
+            baseline = json.load(file)
+        if baseline["parameters"] != results["parameters"]:
+            print("baseline was run with other parameters, the comparison is approximate")
+        regressions = compare(results, baseline, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
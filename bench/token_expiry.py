@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import datetime
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, seed, free_port, wait_for
+
+SECRET = "bench-secret-key"
+SERVERS = {
+    "sync": [sys.executable, "-c", "import main; main.create_app().run(port={port}, threaded=True)"],
+    "gunicorn": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", "127.0.0.1:{port}",
+                 "--backlog", "2048"],
+}
+
+
+def tokens(count: int):
+    # every client signed in with an access token that has just expired and a valid refresh token
+    from flask import Flask
+    from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token
+
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = SECRET
+    JWTManager(app)
+    claims = {"username": "bench", "admin": 0}
+    with app.app_context():
+        return [(create_access_token("1", additional_claims=claims, expires_delta=datetime.timedelta(seconds=-1)),
+                 create_refresh_token("1", additional_claims=claims)) for _ in range(count)]
+
+
+async def get(port: int, path: str, cookies: dict, timeout: float):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        cookie = "; ".join(f"{name}={value}" for name, value in cookies.items())
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\n"
+                     f"Connection: close\r\n\r\n".encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head = response.split(b"\r\n\r\n", 1)[0].decode("latin-1").split("\r\n")
+    headers = [line.split(": ", 1) for line in head[1:]]
+    set_cookies = dict(value.split(";", 1)[0].split("=", 1) for name, value in headers
+                       if name.lower() == "set-cookie")
+    location = next((value for name, value in headers if name.lower() == "location"), None)
+    return int(head[0].split(" ", 2)[1]), location, set_cookies
+
+
+async def expire_all(port: int, pairs: list, timeout: float):
+    # all clients come back at once with expired access tokens, then follow the redirect
+    latencies = []
+    results = {"renewed": 0, "signed out": 0, "followed": 0, "errors": {}}
+
+    async def client(access_token: str, refresh_token: str):
+        cookies = {"access_token_cookie": access_token, "refresh_token_cookie": refresh_token}
+        start = time.perf_counter()
+        try:
+            status, location, set_cookies = await get(port, "/", cookies, timeout)
+            latencies.append(time.perf_counter() - start)
+            if status != 302 or "access_token_cookie" not in set_cookies:
+                results["signed out"] += 1
+                return
+            results["renewed"] += 1
+            cookies.update(set_cookies)
+            status, _, _ = await get(port, location, cookies, timeout)
+            if status == 200:
+                results["followed"] += 1
+        except Exception as error:
+            key = str(error) or type(error).__name__
+            results["errors"][key] = results["errors"].get(key, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(*pair) for pair in pairs))
+    results["seconds"] = round(time.perf_counter() - start, 2)
+    latencies.sort()
+    if latencies:
+        results["p50 ms"] = round(statistics.median(latencies) * 1000, 1)
+        results["p99 ms"] = round(latencies[int(len(latencies) * 0.99)] * 1000, 1)
+    return results
+
+
+def run(mode: str, database: str, pairs: list, port: int, timeout: float):
+    port = port or free_port()
+    command = [part.format(port=port) for part in SERVERS[mode]]
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{database}", "JWT_SECRET_KEY": SECRET}
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port)
+        return asyncio.run(expire_all(port, pairs, timeout))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Many signed-in clients whose access tokens expire at the same moment: each must get a "
+                    "renewed token from its refresh token and reach the page it asked for")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=30, help="per request, in seconds")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--modes", nargs="+", choices=SERVERS, default=list(SERVERS))
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+
+    from db.db_operations import DatabaseOperations
+
+    database = os.path.join(tempfile.mkdtemp(), "db.sqlite")
+    seed(DatabaseOperations(database), 30)
+    pairs = tokens(args.clients)
+
+    for mode in args.modes:
+        if mode == "gunicorn" and importlib.util.find_spec("gunicorn") is None:
+            print(f"{mode:<10}skipped, not installed: gunicorn")
+            continue
+        print(f"{mode:<10}{json.dumps(run(mode, database, pairs, args.port, args.timeout), ensure_ascii=False)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import base64
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from common import ROOT
+
+PORT = 5077
+
+
+def make_photo(path: str, width: int, height: int):
+    from PIL import Image
+
+    # noise keeps the JPEG close to the size of a real photo
+    image = Image.frombytes("RGB", (width, height), random.randbytes(width * height * 3))
+    image.save(path, "JPEG", quality=85)
+
+
+def serve(workdir: str):
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    os.makedirs("static/uploads", exist_ok=True)
+
+    from werkzeug.serving import make_server
+
+    import main
+
+    app = main.create_app({"DATABASE_URL": "sqlite:///db.sqlite"})
+    make_server("127.0.0.1", PORT, app, threaded=True).serve_forever()
+
+
+def peak_rss(pid: int):
+    with open(f"/proc/{pid}/status") as status:
+        values = dict(line.split(":", 1) for line in status)
+    return int(values["VmRSS"].split()[0]) // 1024, int(values["VmHWM"].split()[0]) // 1024
+
+
+def upload(mode: str, images: list, session: requests.Session):
+    url = f"http://127.0.0.1:{PORT}/api/recipes"
+    recipe = {"title": "Рецепт", "description": "Описание", "tags": "тест",
+              "ingredients": [{"name": "мука", "amount": 100, "unit": "GRAM"}]}
+    if mode == "json":
+        encode = lambda path: base64.b64encode(open(path, "rb").read()).decode()
+        recipe["main_image"] = encode(images[0])
+        recipe["recipe_parts"] = [{"text": f"Шаг {i}", "step_image": encode(path)} for i, path in enumerate(images)]
+        return session.post(url, json=recipe).json()
+
+    recipe["ingredients"] = json.dumps(recipe["ingredients"])
+    recipe["recipe_parts"] = json.dumps([{"text": f"Шаг {i}"} for i in range(len(images))])
+    files = {"main_image": open(images[0], "rb")}
+    files.update({f"recipe_parts-{i}-step_image": open(path, "rb") for i, path in enumerate(images)})
+    return session.post(url, data=recipe, files=files).json()
+
+
+def run(mode: str, images: list):
+    workdir = tempfile.mkdtemp()
+    server = subprocess.Popen([sys.executable, __file__, "--serve", workdir],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        session = requests.Session()
+        for _ in range(100):
+            try:
+                session.post(f"http://127.0.0.1:{PORT}/api/register", json={"username": "bench", "password": "bench"})
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        tokens = session.post(f"http://127.0.0.1:{PORT}/api/login",
+                              json={"username": "bench", "password": "bench"}).json()
+        session.cookies.set("access_token_cookie", tokens["access_token"])
+        # warm up imports and the image codecs with a single small image
+        upload(mode, images[:1], session)
+
+        before, _ = peak_rss(server.pid)
+        start = time.perf_counter()
+        response = upload(mode, images, session)
+        elapsed = time.perf_counter() - start
+        _, peak = peak_rss(server.pid)
+        if "id" not in response:
+            raise RuntimeError(response)
+        return {"mode": mode, "rss_before_mb": before, "peak_mb": peak, "growth_mb": peak - before,
+                "seconds": round(elapsed, 2)}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Peak server memory while creating a recipe with many step photos, "
+                    "base64 JSON vs multipart/form-data")
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--width", type=int, default=2400)
+    parser.add_argument("--height", type=int, default=1600)
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    workdir = tempfile.mkdtemp()
+    images = []
+    for i in range(args.images):
+        images.append(os.path.join(workdir, f"{i}.jpg"))
+        make_photo(images[-1], args.width, args.height)
+    size = sum(os.path.getsize(path) for path in images) // (1024 * 1024)
+    print(f"{args.images} images, {size} MB on disk")
+
+    for mode in ("json", "multipart"):
+        # each mode gets a fresh server process so that peak RSS is not shared
+        print(json.dumps(run(mode, images)))
+
+
+if __name__ == '__main__':
+    main()
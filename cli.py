@@ -0,0 +1,94 @@
+import time
+
+import click
+from flask.cli import with_appcontext
+
+from db import search
+from db.db_session import create_session
+
+
+@click.command("rebuild-search-index")
+def rebuild_search_index():
+    """Rebuild the recipe full-text search index from the recipe table."""
+    with create_session() as session:
+        if not search.is_supported(session.get_bind()):
+            raise click.ClickException("Full-text search index is only available on SQLite")
+        search.rebuild(session.connection())
+        session.commit()
+    click.echo("Search index rebuilt")
+
+
+@click.command("migrate")
+def migrate():
+    """Bring an existing database up to date with the current models."""
+    from db import migrations
+
+    for name, changed in migrations.upgrade():
+        click.echo(f"{name}: {changed}")
+
+
+@click.command("process-images")
+@with_appcontext
+def process_images():
+    """Generate image variants for uploads the background pipeline did not finish."""
+    import services
+
+    click.echo(f"Processed {services.storage.process_pending()} images")
+
+
+@click.command("gc-images")
+@click.option("--grace", default=3600, show_default=True, help="Keep unreferenced files younger than this (seconds).")
+@click.option("--dry-run", is_flag=True, help="Only list the files that would be removed.")
+@with_appcontext
+def collect_garbage(grace, dry_run):
+    """Remove uploaded files that no recipe or recipe step references."""
+    import services
+
+    removed = services.storage.collect_garbage(services.db.get_image_paths(), grace=grace, dry_run=dry_run)
+    for file in removed:
+        click.echo(file)
+    click.echo(f"{'Would remove' if dry_run else 'Removed'} {len(removed)} files")
+
+
+@click.command("import-recipes")
+@click.argument("file", type=click.File("rb"))
+@click.option("--username", required=True, help="Author of the imported recipes.")
+@click.option("--chunk-size", default=500, show_default=True, help="Recipes per transaction.")
+def import_recipes(file, username, chunk_size):
+    """Import recipes from an NDJSON file, one recipe per line ("-" reads stdin)."""
+    import services
+
+    user = services.db.get_user_by_username(username)
+    if not user:
+        raise click.ClickException(f"User {username} not found")
+    try:
+        result = services.import_recipes(file, user["id"], chunk_size)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo(f"Imported {result['imported']} recipes in {result['seconds']}s "
+               f"({result['recipes_per_second']} recipes/s)")
+
+
+@click.command("export-recipes")
+@click.argument("file", type=click.File("w", encoding="utf-8"))
+@click.option("--user-id", type=int, help="Only the recipes of this user.")
+def export_recipes(file, user_id):
+    """Export recipes with their ingredients and steps as NDJSON ("-" writes to stdout)."""
+    import services
+
+    start = time.perf_counter()
+    count = 0
+    for line in services.export_recipes(user_id=user_id):
+        file.write(line)
+        count += 1
+    seconds = time.perf_counter() - start
+    click.echo(f"Exported {count} recipes in {seconds:.3f}s ({count / seconds:.1f} recipes/s)", err=True)
+
+
+@click.command("profile-token")
+@with_appcontext
+def profile_token():
+    """Print a value for the X-Profile header: requests carrying it are profiled while it is valid."""
+    from profiling import profiler
+
+    click.echo(profiler.token())
@@ -0,0 +1,42 @@
+from contextlib import contextmanager
+
+from db.cache import CachedDatabaseOperations
+from db.db_session import SQLITE_PRAGMAS, create_async_engine
+
+
+class BoundOperations(CachedDatabaseOperations):
+    # The synchronous query code, run against the sync facade of an AsyncSession inside run_sync().
+    # Reads still go through the shared cache of the operations it was bound from.
+    def __init__(self, operations, session):
+        self.cache = getattr(operations, "cache", None)
+        self.storage = operations.storage
+        self.bound_session = session
+
+    @contextmanager
+    def session(self, readonly: bool = False):
+        yield self.bound_session
+
+
+class AsyncDatabaseOperations:
+    def __init__(self, operations):
+        self.operations = operations
+        self.factories = {}
+
+    def init_app(self, app):
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        for readonly in (False, True):
+            engine = create_async_engine(app.config["DATABASE_URL"], readonly=readonly,
+                                         pragmas={**SQLITE_PRAGMAS, "cache_size": -app.config["DATABASE_CACHE_KB"]},
+                                         pool_size=app.config["DATABASE_POOL_SIZE"],
+                                         max_overflow=app.config["DATABASE_MAX_OVERFLOW"])
+            self.factories[readonly] = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def call(self, method: str, *args, readonly: bool = True, **kwargs):
+        async with self.factories[readonly]() as session:
+            return await session.run_sync(
+                lambda sync_session: getattr(BoundOperations(self.operations, sync_session), method)(*args, **kwargs))
+
+    async def dispose(self):
+        for factory in self.factories.values():
+            await factory.kw["bind"].dispose()
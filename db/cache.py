@@ -0,0 +1,186 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_app_context
+
+from db.db_operations import DatabaseOperations
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "lru", "hits": self.hits, "misses": self.misses, "size": len(self._entries),
+                    "maxsize": self.maxsize, "ttl": self.ttl}
+
+
+class RedisCache:
+    def __init__(self, client=None, url: str = None, ttl: float = 300, prefix: str = "cookbook:"):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: str):
+        self.client.set(self.prefix + key, value, ex=int(self.ttl))
+
+    def stats(self):
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses, "ttl": self.ttl}
+
+
+def create_cache(config):
+    cache_type = config.get("CACHE_TYPE", "lru")
+    if cache_type == "redis":
+        return RedisCache(url=config["CACHE_REDIS_URL"], ttl=config.get("CACHE_TTL", 300))
+    if cache_type == "lru":
+        return LRUCache(maxsize=config.get("CACHE_SIZE", 1024), ttl=config.get("CACHE_TTL", 300))
+    return None
+
+
+def recipe_version_key(version: tuple):
+    # with the time, a deleted recipe's entry is not served for a new recipe that reuses its id
+    return f"{version[0]}@{version[1]}" if version else None
+
+
+class CachedDatabaseOperations(DatabaseOperations):
+    # Cached values live under keys that embed the data versions stored in the database, the same
+    # ones the ETags are made of, so a write in any worker process makes every process miss:
+    #   "recipes"     - DataVersion of every recipe list (feed, search, profiles)
+    #   "users"       - DataVersion of users and user lists
+    #   "recipe:<id>" - Recipe.version of one recipe, bumped by its changes and by renaming its author
+    # Versions already read in the current request (for its ETag) are reused; writes forget them.
+    def __init__(self, database: str = None, cache=None, storage=None, **engine_options):
+        super().__init__(database, storage, **engine_options)
+        self.cache = cache
+        self.cache_from_config = cache is None
+
+    def init_app(self, app):
+        super().init_app(app)
+        if self.cache_from_config:
+            self.cache = create_cache(app.config)
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache else {"backend": None}
+
+    @staticmethod
+    def request_versions() -> dict:
+        # outside a request (CLI, the async API) the versions are looked up for every cached read
+        return g.setdefault("data_versions", {}) if has_app_context() else {}
+
+    def forget_versions(self):
+        if has_app_context():
+            g.pop("data_versions", None)
+
+    def get_data_versions(self, *names):
+        versions = super().get_data_versions(*names)
+        self.request_versions().update({name: versions.get(name, (0,))[0] for name in names})
+        return versions
+
+    def get_recipe_version(self, recipe_id: int):
+        version = super().get_recipe_version(recipe_id)
+        self.request_versions()[f"recipe:{recipe_id}"] = recipe_version_key(version)
+        return version
+
+    def version(self, name: str):
+        versions = self.request_versions()
+        if name not in versions:
+            if name.startswith("recipe:"):
+                versions[name] = recipe_version_key(super().get_recipe_version(int(name.split(":")[1])))
+            else:
+                versions[name] = super().get_data_versions(name).get(name, (0,))[0]
+        return versions[name]
+
+    def cached(self, key: str, versions: list, load, *args, **kwargs):
+        if not self.cache:
+            return load(*args, **kwargs)
+        key = ":".join([key] + [str(self.version(name)) for name in versions])
+        value = self.cache.get(key)
+        if value is not None:
+            return json.loads(value)
+        result = load(*args, **kwargs)
+        self.cache.set(key, json.dumps(result, ensure_ascii=False))
+        return result
+
+    def get_user_by_id(self, user_id: int):
+        return self.cached(f"user:{user_id}", ["users"], super().get_user_by_id, user_id)
+
+    def get_users(self, page: int = 1, cursor: str = None, pages_info: bool = False):
+        return self.cached(f"users:{page}:{cursor}:{bool(pages_info)}", ["users"],
+                           super().get_users, page=page, cursor=cursor, pages_info=pages_info)
+
+    def get_recipe_by_id(self, recipe_id: int):
+        return self.cached(f"recipe:{recipe_id}", [f"recipe:{recipe_id}"], super().get_recipe_by_id, recipe_id)
+
+    def get_recipes(self, tags: str = None, title: str = None, user_id: int = None, page: int = 1,
+                    cursor: str = None, pages_info: bool = False):
+        key = "recipes:" + json.dumps([tags, title, str(user_id) if user_id else None, page, cursor,
+                                       bool(pages_info)], ensure_ascii=False)
+        return self.cached(key, ["recipes"], super().get_recipes, tags=tags, title=title, user_id=user_id,
+                           page=page, cursor=cursor, pages_info=pages_info)
+
+    def create_user(self, username: str, password: str, about: str = None, admin: bool = False):
+        self.forget_versions()
+        return super().create_user(username, password, about, admin)
+
+    def update_user(self, user_id: int, **kwargs):
+        self.forget_versions()
+        return super().update_user(user_id, **kwargs)
+
+    def create_recipe(self, title: str, description: str, user_id: int,
+                      tags: str = None, image: str = None,
+                      ingredients: list = None, recipe_parts: list = None):
+        self.forget_versions()
+        return super().create_recipe(title, description, user_id, tags, image, ingredients, recipe_parts)
+
+    def import_chunk(self, recipes: list, user_id: int):
+        self.forget_versions()
+        return super().import_chunk(recipes, user_id)
+
+    def update_recipe(self, recipe_id: int, **kwargs):
+        self.forget_versions()
+        return super().update_recipe(recipe_id, **kwargs)
+
+    def delete_recipe(self, recipe_id: int):
+        self.forget_versions()
+        return super().delete_recipe(recipe_id)
@@ -1,14 +1,183 @@
-from db.db_session import global_init, create_session
-from db.models.recipe import Recipe, Ingredient, RecipePart
+import base64
+import datetime
+import json
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import has_app_context
+
+from db import search, recipe_cards
+from db.db_session import SQLITE_PRAGMAS, global_init, create_session, scoped_session, remove_scoped_sessions
+from db.models.recipe import Recipe, Ingredient, RecipePart, Unit
+from db.models.recipe_card import RecipeCard
+from db.models.tag import Tag, recipe_tag
 from db.models.user import User
+from db.models.version import DataVersion
+
+PAGE_SIZE = 10
+BULK_CHUNK_SIZE = 500
+
+USER_COLUMNS = (User.id, User.username, User.about, User.admin)
+RECIPE_COLUMNS = (Recipe.id, Recipe.title, Recipe.description, Recipe.tags, Recipe.created_date, Recipe.image,
+                  User.id.label("user_id"), User.username)
+CARD_COLUMNS = (RecipeCard.id, RecipeCard.title, RecipeCard.description, RecipeCard.tags, RecipeCard.created_date,
+                RecipeCard.image, RecipeCard.user_id, RecipeCard.username)
+
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types):
+    # cursors come back from clients: every value is checked against its type, datetimes are ISO strings
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return [parse_cursor_value(value, kind) for value, kind in zip(values, types)]
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_cursor_value(value, kind):
+    if kind is datetime.datetime:
+        return datetime.datetime.fromisoformat(value)
+    if kind is float:
+        kind = (int, float)
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise TypeError
+    return value
+
+
+def parse_unit(unit):
+    # the API returns unit values ("г"), create_recipe() takes enum names ("GRAM"); bulk imports accept both
+    if isinstance(unit, Unit):
+        return unit
+    return Unit[unit] if unit in Unit.__members__ else Unit(unit)
+
+
+def chunks(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def serialize_recipe(row):
+    return {
+        "id": row.id,
+        "title": row.title,
+        "description": row.description,
+        "tags": row.tags,
+        "created_date": row.created_date.strftime(Recipe.datetime_format) if row.created_date else None,
+        "image": row.image,
+        "user": {"id": row.user_id, "username": row.username},
+    }
 
 
 class DatabaseOperations:
-    def __init__(self, db_file: str):
-        global_init(db_file)
+    def __init__(self, database: str = None, storage=None, **engine_options):
+        self.storage = storage
+        if database:
+            global_init(database, **engine_options)
+
+    def init_app(self, app):
+        global_init(app.config["DATABASE_URL"],
+                    pragmas={**SQLITE_PRAGMAS, "cache_size": -app.config["DATABASE_CACHE_KB"]},
+                    pool_size=app.config["DATABASE_POOL_SIZE"],
+                    max_overflow=app.config["DATABASE_MAX_OVERFLOW"],
+                    read_pool_size=app.config["DATABASE_POOL_SIZE"],
+                    read_max_overflow=app.config["DATABASE_MAX_OVERFLOW"])
+        app.teardown_appcontext(self.remove_sessions)
+
+    @staticmethod
+    def remove_sessions(exception=None):
+        remove_scoped_sessions()
+
+    @contextmanager
+    def session(self, readonly: bool = False):
+        if not has_app_context():
+            with create_session(readonly) as session:
+                yield session
+            return
+
+        # inside a request all calls share one session per pool, released on app context teardown
+        session = scoped_session(readonly)
+        try:
+            yield session
+        except Exception:
+            session.rollback()
+            raise
+        if not readonly:
+            # let the following reads in this request see what was just committed
+            scoped_session(readonly=True).rollback()
+
+    @staticmethod
+    def bump_versions(session, *names):
+        # list validators (ETags) are derived from these counters, so every write bumps the ones it affects
+        now = datetime.datetime.now()
+        for name in names:
+            updated = session.execute(sa.update(DataVersion).where(DataVersion.name == name)
+                                      .values(version=DataVersion.version + 1, updated_date=now)).rowcount
+            if not updated:
+                session.add(DataVersion(name=name, version=1, updated_date=now))
+
+    def get_data_versions(self, *names):
+        with self.session(readonly=True) as session:
+            rows = session.query(DataVersion.name, DataVersion.version, DataVersion.updated_date) \
+                .filter(DataVersion.name.in_(names)).all()
+            return {name: (version, updated_date) for name, version, updated_date in rows}
+
+    def get_recipe_version(self, recipe_id: int):
+        with self.session(readonly=True) as session:
+            row = session.query(Recipe.version, Recipe.created_date, Recipe.updated_date) \
+                .filter(Recipe.id == recipe_id).first()
+            return (row.version, row.updated_date or row.created_date) if row else None
+
+    def get_image_paths(self):
+        with self.session(readonly=True) as session:
+            images = sa.union(sa.select(Recipe.image), sa.select(RecipePart.image))
+            return {path for path, in session.execute(images) if path}
+
+    def release_images(self, session, paths):
+        # image files are shared between recipes with identical uploads, release the ones nothing references
+        paths = {path for path in paths if path}
+        if not paths or not self.storage:
+            return
+        referenced = sa.union(sa.select(Recipe.image).where(Recipe.image.in_(paths)),
+                              sa.select(RecipePart.image).where(RecipePart.image.in_(paths)))
+        self.storage.release(paths - {path for path, in session.execute(referenced)})
+
+    @staticmethod
+    def get_or_create_tags(session, tags: str):
+        names = Tag.parse(tags)
+        if not names:
+            return []
+        existing = {tag.name: tag for tag in session.query(Tag).filter(Tag.name.in_(names))}
+        for name in names:
+            if name not in existing:
+                existing[name] = Tag(name=name)
+                session.add(existing[name])
+        return [existing[name] for name in names]
+
+    def get_user_credentials(self, username: str):
+        # everything sign-in needs in one query
+        with self.session(readonly=True) as session:
+            user = session.query(User.id, User.username, User.password, User.admin) \
+                .filter(User.username == username).first()
+            return user._asdict() if user else None
+
+    def set_password_hash(self, user_id: int, password_hash: str):
+        with self.session() as session:
+            session.execute(sa.update(User).where(User.id == user_id).values(password=password_hash))
+            session.commit()
 
     def check_user_password(self, username: str, password: str):
-        with create_session() as session:
+        with self.session(readonly=True) as session:
             user = session.query(User).filter(User.username == username).first()
             if user and user.check_password(password):
                 return True
@@ -16,18 +185,19 @@ class DatabaseOperations:
                 return False
 
     def create_user(self, username: str, password: str, about: str = None, admin: bool = False):
-        with create_session() as session:
+        with self.session() as session:
             user = User(username=username,
                         about=about,
                         admin=admin)
             user.set_password(password)
+            self.bump_versions(session, "users")
             session.add(user)
             session.commit()
             session.refresh(user)
             return user.id
 
     def update_user(self, user_id: int, **kwargs):
-        with create_session() as session:
+        with self.session() as session:
             user = session.query(User).filter(User.id == user_id).first()
             if user:
                 for key, value in kwargs.items():
@@ -36,37 +206,49 @@ class DatabaseOperations:
                             setattr(user, key, value)
                         else:
                             user.set_password(value)
+                self.bump_versions(session, "users")
+                if "username" in kwargs:
+                    # the author's name is part of every recipe representation
+                    session.query(Recipe).filter(Recipe.user_id == user_id).update(
+                        {Recipe.version: Recipe.version + 1, Recipe.updated_date: datetime.datetime.now()},
+                        synchronize_session=False)
+                    recipe_cards.rename_user(session, user_id, kwargs["username"])
+                    self.bump_versions(session, "recipes")
                 session.commit()
                 session.refresh(user)
                 return user.id
             return None
 
     def get_user_by_id(self, user_id: int):
-        with create_session() as session:
-            user = session.query(User).filter(User.id == user_id).first()
-            serialized_values = ["id", "username", "about", "admin"]
-            return user.to_dict(only=serialized_values) if user else None
+        with self.session(readonly=True) as session:
+            user = session.query(*USER_COLUMNS).filter(User.id == user_id).first()
+            return user._asdict() if user else None
 
     def get_user_by_username(self, username: str):
-        with create_session() as session:
-            user = session.query(User).filter(User.username == username).first()
-            serialized_values = ["id", "username", "about", "admin"]
-            return user.to_dict(only=serialized_values) if user else None
+        with self.session(readonly=True) as session:
+            user = session.query(*USER_COLUMNS).filter(User.username == username).first()
+            return user._asdict() if user else None
 
-    def get_users(self, page: int = 1):
-        with create_session() as session:
-            query = session.query(User)
-            total_pages = (query.count() + 9) // 10
-            offset = (page - 1) * 10
-            users = query.offset(offset).limit(10).all()
+    def get_users(self, page: int = 1, cursor: str = None, pages_info: bool = False):
+        with self.session(readonly=True) as session:
+            query = session.query(*USER_COLUMNS)
+            total_pages = (query.count() + PAGE_SIZE - 1) // PAGE_SIZE if pages_info else None
 
-            serialized_fields = ["id", "username", "about", "admin"]
-            return [u.to_dict(only=serialized_fields) for u in users], total_pages
+            query = query.order_by(User.id)
+            if cursor:
+                last_id, = decode_cursor(cursor, int)
+                query = query.filter(User.id > last_id)
+            else:
+                query = query.offset((page - 1) * PAGE_SIZE)
+            users = query.limit(PAGE_SIZE + 1).all()
+            next_cursor = encode_cursor(users[PAGE_SIZE - 1].id) if len(users) > PAGE_SIZE else None
+            return [u._asdict() for u in users[:PAGE_SIZE]], total_pages, next_cursor
 
     def create_recipe(self, title: str, description: str, user_id: int,
                       tags: str = None, image: str = None,
                       ingredients: list = None, recipe_parts: list = None):
-        with create_session() as session:
+        with self.session() as session:
+            self.bump_versions(session, "recipes")
             recipe = Recipe(
                 title=title,
                 description=description,
@@ -74,6 +256,7 @@ class DatabaseOperations:
                 image=image,
                 user_id=user_id
             )
+            recipe.tag_list = self.get_or_create_tags(session, tags)
 
             if ingredients:
                 for ing in ingredients:
@@ -92,18 +275,24 @@ class DatabaseOperations:
                     recipe.recipe_parts.append(recipe_part)
 
             session.add(recipe)
+            session.flush()
+            recipe_cards.refresh(session, [recipe.id])
             session.commit()
             session.refresh(recipe)
             return recipe.id
 
     def update_recipe(self, recipe_id: int, **kwargs):
-        with create_session() as session:
+        with self.session() as session:
             recipe = session.query(Recipe).filter(Recipe.id == recipe_id).first()
             if recipe:
+                images = [recipe.image] + [part.image for part in recipe.recipe_parts]
                 for key, value in kwargs.items():
                     if hasattr(recipe, key) and key not in ['ingredients', 'recipe_parts']:
                         setattr(recipe, key, value)
 
+                if 'tags' in kwargs:
+                    recipe.tag_list = self.get_or_create_tags(session, kwargs['tags'])
+
                 if 'ingredients' in kwargs:
                     for ingredient in recipe.ingredients[:]:
                         session.delete(ingredient)
@@ -127,47 +316,172 @@ class DatabaseOperations:
                         )
                         recipe.recipe_parts.append(recipe_part)
 
+                recipe.version = Recipe.version + 1
+                recipe.updated_date = datetime.datetime.now()
+                session.flush()
+                recipe_cards.refresh(session, [recipe_id])
+                self.bump_versions(session, "recipes")
                 session.commit()
+                self.release_images(session, images)
                 session.refresh(recipe)
                 return recipe.id
             return None
 
     def get_recipe_by_id(self, recipe_id: int):
-        with create_session() as session:
-            recipe = session.query(Recipe).filter(Recipe.id == recipe_id).first()
-            serialized_fields = ["id", "title", "description", "tags", "created_date", "image",
-                                 "user.id", "user.username",
-                                 "ingredients.name", "ingredients.amount", "ingredients.unit",
-                                 "recipe_parts.text", "recipe_parts.image"]
-            return recipe.to_dict(max_serialization_depth=1, only=serialized_fields) if recipe else None
-
-    def get_recipes(self, tags: str = None, title: str = None, user_id: int = None, page: int = 1):
-        with create_session() as session:
-            query = session.query(Recipe)
+        with self.session(readonly=True) as session:
+            row = session.query(*RECIPE_COLUMNS).join(User, User.id == Recipe.user_id) \
+                .filter(Recipe.id == recipe_id).first()
+            if not row:
+                return None
+            recipe = serialize_recipe(row)
+            ingredients = session.query(Ingredient.name, Ingredient.amount, Ingredient.unit) \
+                .filter(Ingredient.recipe_id == recipe_id).order_by(Ingredient.id).all()
+            recipe["ingredients"] = [{"name": name, "amount": amount, "unit": unit.value}
+                                     for name, amount, unit in ingredients]
+            recipe_parts = session.query(RecipePart.text, RecipePart.image) \
+                .filter(RecipePart.recipe_id == recipe_id).order_by(RecipePart.id).all()
+            recipe["recipe_parts"] = [part._asdict() for part in recipe_parts]
+            return recipe
+
+    def get_recipes(self, tags: str = None, title: str = None, user_id: int = None, page: int = 1,
+                    cursor: str = None, pages_info: bool = False):
+        with self.session(readonly=True) as session:
+            query = session.query(RecipeCard.id)
             if user_id:
-                query = query.filter(Recipe.user_id == user_id)
-            if title:
-                query = query.filter(Recipe.title.ilike(f"%{title}%"))
-            if tags:
-                tag_list = [tag.strip() for tag in tags.split(',')]
-                for tag in tag_list:
-                    query = query.filter(Recipe.tags.ilike(f"%{tag}%"))
+                query = query.filter(RecipeCard.user_id == user_id)
 
-            total_pages = (query.count() + 9) // 10
+            tag_names = Tag.parse(tags)
+            if tag_names:
+                matches = [sa.select(recipe_tag.c.recipe_id).where(
+                    recipe_tag.c.tag_id == sa.select(Tag.id).where(Tag.name == name).scalar_subquery())
+                    for name in tag_names]
+                query = query.filter(RecipeCard.id.in_(matches[0] if len(matches) == 1 else sa.intersect(*matches)))
 
-            query = query.order_by(Recipe.created_date.desc())
-            offset = (page - 1) * 10
-            recipes = query.offset(offset).limit(10).all()
+            match = search.match_expression(title)
+            ranked = bool(match) and search.is_supported(session.get_bind())
+            if ranked:
+                query = query.join(search.recipe_fts, search.recipe_fts.c.rowid == RecipeCard.id) \
+                    .filter(search.recipe_fts.c.recipe_fts.match(match))
+            elif title:
+                query = query.filter(RecipeCard.title.ilike(f"%{title}%"))
 
-            serialized_fields = ["id", "title", "description", "tags", "created_date", "image",
-                                 "user.id", "user.username"]
-            return [r.to_dict(max_serialization_depth=1, only=serialized_fields) for r in recipes], total_pages
+            total_pages = (query.count() + PAGE_SIZE - 1) // PAGE_SIZE if pages_info else None
+
+            # newest first; a title search by relevance first (lower bm25 is better), and its cursors
+            # carry the rank, so the following pages keep the order of the first one
+            newer = sa.tuple_(RecipeCard.created_date, RecipeCard.id)
+            if ranked:
+                rank = search.bm25()
+                query = query.with_entities(*CARD_COLUMNS, rank.label("rank")) \
+                    .order_by(rank, RecipeCard.created_date.desc(), RecipeCard.id.desc())
+            else:
+                query = query.with_entities(*CARD_COLUMNS) \
+                    .order_by(RecipeCard.created_date.desc(), RecipeCard.id.desc())
+            if cursor and ranked:
+                last_rank, last_date, last_id = decode_cursor(cursor, float, datetime.datetime, int)
+                query = query.filter(sa.or_(rank > last_rank, sa.and_(rank == last_rank,
+                                                                      newer < (last_date, last_id))))
+            elif cursor:
+                last_date, last_id = decode_cursor(cursor, datetime.datetime, int)
+                query = query.filter(newer < (last_date, last_id))
+            else:
+                query = query.offset((page - 1) * PAGE_SIZE)
+            recipes = query.limit(PAGE_SIZE + 1).all()
+
+            next_cursor = None
+            if len(recipes) > PAGE_SIZE:
+                last = recipes[PAGE_SIZE - 1]
+                values = (last.created_date.isoformat(), last.id)
+                next_cursor = encode_cursor(last.rank, *values) if ranked else encode_cursor(*values)
+            return [serialize_recipe(r) for r in recipes[:PAGE_SIZE]], total_pages, next_cursor
 
     def delete_recipe(self, recipe_id: int):
-        with create_session() as session:
+        with self.session() as session:
             recipe = session.query(Recipe).filter(Recipe.id == recipe_id).first()
             if recipe:
+                images = [recipe.image] + [part.image for part in recipe.recipe_parts]
+                recipe_cards.delete(session, [recipe_id])
                 session.delete(recipe)
+                self.bump_versions(session, "recipes")
                 session.commit()
+                self.release_images(session, images)
                 return recipe
             return None
+
+    def import_recipes(self, recipes, user_id: int, chunk_size: int = BULK_CHUNK_SIZE):
+        # one transaction and a handful of multi-row INSERTs per chunk instead of a session per recipe;
+        # chunks committed before an error stay imported
+        count = 0
+        for chunk in chunks(recipes, chunk_size):
+            count += len(self.import_chunk(chunk, user_id))
+        return count
+
+    def import_chunk(self, recipes: list, user_id: int):
+        with self.session() as session:
+            self.bump_versions(session, "recipes")
+            rows = []
+            for recipe in recipes:
+                row = {"title": recipe["title"], "description": recipe["description"], "tags": recipe.get("tags"),
+                       "image": recipe.get("image"), "user_id": user_id}
+                if recipe.get("created_date"):
+                    row["created_date"] = datetime.datetime.strptime(recipe["created_date"], Recipe.datetime_format)
+                rows.append(row)
+            ids = session.scalars(sa.insert(Recipe).returning(Recipe.id, sort_by_parameter_order=True), rows).all()
+
+            ingredients = [{"recipe_id": recipe_id, "name": ing["name"], "amount": ing["amount"],
+                            "unit": parse_unit(ing["unit"])}
+                           for recipe_id, recipe in zip(ids, recipes) for ing in recipe.get("ingredients") or []]
+            if ingredients:
+                session.execute(sa.insert(Ingredient), ingredients)
+            parts = [{"recipe_id": recipe_id, "text": part["text"], "image": part.get("image")}
+                     for recipe_id, recipe in zip(ids, recipes) for part in recipe.get("recipe_parts") or []]
+            if parts:
+                session.execute(sa.insert(RecipePart), parts)
+
+            names = {recipe_id: Tag.parse(recipe.get("tags")) for recipe_id, recipe in zip(ids, recipes)}
+            all_names = {name for recipe_names in names.values() for name in recipe_names}
+            if all_names:
+                tag_ids = dict(session.execute(sa.select(Tag.name, Tag.id).where(Tag.name.in_(all_names))).all())
+                missing = [{"name": name} for name in sorted(all_names - tag_ids.keys())]
+                if missing:
+                    tag_ids.update(session.execute(sa.insert(Tag).returning(Tag.name, Tag.id), missing).all())
+                session.execute(sa.insert(recipe_tag), [{"recipe_id": recipe_id, "tag_id": tag_ids[name]}
+                                                        for recipe_id, recipe_names in names.items()
+                                                        for name in recipe_names])
+            recipe_cards.refresh(session, ids)
+            session.commit()
+            return ids
+
+    def iter_recipes(self, user_id: int = None, chunk_size: int = BULK_CHUNK_SIZE):
+        # full recipes in id order, read chunk by chunk with keyset pagination so that an export
+        # never holds more than one chunk in memory
+        last_id = 0
+        while True:
+            with self.session(readonly=True) as session:
+                query = session.query(*RECIPE_COLUMNS).join(User, User.id == Recipe.user_id) \
+                    .filter(Recipe.id > last_id)
+                if user_id:
+                    query = query.filter(Recipe.user_id == user_id)
+                rows = query.order_by(Recipe.id).limit(chunk_size).all()
+                if not rows:
+                    return
+                recipes = {row.id: serialize_recipe(row) | {"ingredients": [], "recipe_parts": []} for row in rows}
+                ingredients = session.query(Ingredient.recipe_id, Ingredient.name, Ingredient.amount, Ingredient.unit) \
+                    .filter(Ingredient.recipe_id.in_(recipes)).order_by(Ingredient.id)
+                for recipe_id, name, amount, unit in ingredients:
+                    recipes[recipe_id]["ingredients"].append({"name": name, "amount": amount, "unit": unit.value})
+                parts = session.query(RecipePart.recipe_id, RecipePart.text, RecipePart.image) \
+                    .filter(RecipePart.recipe_id.in_(recipes)).order_by(RecipePart.id)
+                for recipe_id, text, image in parts:
+                    recipes[recipe_id]["recipe_parts"].append({"text": text, "image": image})
+            yield from recipes.values()
+            last_id = rows[-1].id
+
+    def get_tags(self):
+        with self.session(readonly=True) as session:
+            rows = session.query(Tag.name, sa.func.count(recipe_tag.c.recipe_id).label("count")) \
+                .join(recipe_tag, recipe_tag.c.tag_id == Tag.id) \
+                .group_by(Tag.id) \
+                .order_by(sa.desc("count"), Tag.name) \
+                .all()
+            return [{"name": name, "count": count} for name, count in rows]
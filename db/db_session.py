@@ -1,3 +1,6 @@
+import os
+import time
+
 import sqlalchemy as sa
 import sqlalchemy.orm as orm
 from sqlalchemy.orm import Session
@@ -5,28 +8,175 @@ import sqlalchemy.ext.declarative as dec
 
 SqlAlchemyBase = dec.declarative_base()
 
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    # memory maps share the OS page cache; the page cache below is private to every connection, in KiB
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -2 * 1024,
+}
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
 factory = None
+read_factory = None
+scoped_sessions = {}
+# the arguments of the global_init() call the engines were created with
+engine_options = None
+# called with (statement, seconds) after every statement on any engine, e.g. to collect metrics
+query_listeners = []
 
 
-def global_init(db_file):
-    global factory
+def make_url(database: str) -> sa.URL:
+    database = database.strip()
+    if "://" not in database:
+        database = f"sqlite:///{database}"
+    return sa.make_url(database)
 
-    if factory:
+
+def create_engine(database: str, readonly: bool = False, pragmas: dict = None,
+                  pool_size: int = 5, max_overflow: int = 10):
+    url = make_url(database)
+    if url.get_backend_name() != "sqlite":
+        connect_args = {}
+        if readonly and url.get_backend_name() == "postgresql":
+            connect_args["options"] = "-c default_transaction_read_only=on"
+        engine = sa.create_engine(url, echo=False, pool_size=pool_size, max_overflow=max_overflow,
+                                  pool_pre_ping=True, connect_args=connect_args)
+        track_queries(engine)
+        return engine
+
+    engine = sa.create_engine(url, echo=False, pool_size=pool_size, max_overflow=max_overflow,
+                              connect_args={"check_same_thread": False})
+    set_pragmas(engine, pragmas, readonly)
+    track_queries(engine)
+    return engine
+
+
+def set_pragmas(engine, pragmas: dict = None, readonly: bool = False):
+    pragmas = dict(SQLITE_PRAGMAS if pragmas is None else pragmas)
+    if readonly:
+        pragmas["query_only"] = "ON"
+
+    @sa.event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+def track_queries(engine):
+    @sa.event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.query_start = time.perf_counter()
+
+    @sa.event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - context.query_start
+        for listener in query_listeners:
+            listener(statement, seconds)
+
+
+def create_async_engine(database: str, readonly: bool = False, pragmas: dict = None,
+                        pool_size: int = 5, max_overflow: int = 10):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = make_url(database)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name())
+    if not drivername:
+        raise Exception(f"No async driver for {url.get_backend_name()}")
+    url = url.set(drivername=drivername)
+    if url.get_backend_name() != "sqlite":
+        connect_args = {}
+        if readonly:
+            connect_args["server_settings"] = {"default_transaction_read_only": "on"}
+        engine = create_async_engine(url, echo=False, pool_size=pool_size, max_overflow=max_overflow,
+                                     pool_pre_ping=True, connect_args=connect_args)
+        track_queries(engine.sync_engine)
+        return engine
+
+    engine = create_async_engine(url, echo=False, pool_size=pool_size, max_overflow=max_overflow)
+    set_pragmas(engine.sync_engine, pragmas, readonly)
+    track_queries(engine.sync_engine)
+    return engine
+
+
+def global_init(database, pragmas: dict = None, pool_size: int = 5, max_overflow: int = 10,
+                read_pool_size: int = 5, read_max_overflow: int = 10):
+    global factory, read_factory, scoped_sessions, engine_options
+
+    options = (database, pragmas, pool_size, max_overflow, read_pool_size, read_max_overflow)
+    if factory and options == engine_options:
         return
 
-    if not db_file or not db_file.strip():
-        raise Exception("Empty db file")
+    if not database or not database.strip():
+        raise Exception("Empty database url")
 
-    conn_str = f'sqlite:///{db_file.strip()}?check_same_thread=False'
+    if factory:
+        # another app with other settings: its engines replace the current ones
+        remove_scoped_sessions()
+        dispose_engines(close=True)
+    else:
+        # a forked worker must not reuse connections inherited from the parent process
+        os.register_at_fork(after_in_child=dispose_engines)
 
-    engine = sa.create_engine(conn_str, echo=False)
-    factory = orm.sessionmaker(bind=engine)
+    engine = create_engine(database, pragmas=pragmas, pool_size=pool_size, max_overflow=max_overflow)
 
     from .models import all_models
 
     SqlAlchemyBase.metadata.create_all(engine)
+    add_missing_columns(engine)
+
+    from . import search, recipe_cards
+
+    search.init_fts(engine)
+    recipe_cards.init_cards(engine)
+
+    read_engine = create_engine(database, readonly=True, pragmas=pragmas,
+                                pool_size=read_pool_size, max_overflow=read_max_overflow)
+    factory = orm.sessionmaker(bind=engine)
+    read_factory = orm.sessionmaker(bind=read_engine)
+    scoped_sessions = {False: orm.scoped_session(factory), True: orm.scoped_session(read_factory)}
+
+    from .migrations import init_tags
+
+    init_tags(engine)
+    engine_options = options
+
+
+def add_missing_columns(engine):
+    # create_all() only creates missing tables; columns added to existing models are appended here
+    inspector = sa.inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as connection:
+        for table in SqlAlchemyBase.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    definition = sa.schema.CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.execute(sa.text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {definition}"))
+
+
+def create_session(readonly: bool = False) -> Session:
+    global factory, read_factory
+    return read_factory() if readonly else factory()
+
+
+def scoped_session(readonly: bool = False) -> Session:
+    return scoped_sessions[readonly]()
+
+
+def remove_scoped_sessions():
+    for registry in scoped_sessions.values():
+        registry.remove()
 
 
-def create_session() -> Session:
-    global factory
-    return factory()
\ No newline at end of file
+def dispose_engines(close: bool = False):
+    for session_factory in (factory, read_factory):
+        if session_factory:
+            session_factory.kw["bind"].dispose(close=close)
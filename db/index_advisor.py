@@ -0,0 +1,110 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import sqlalchemy as sa
+
+
+def workload(db):
+    user_id = db.create_user("index-advisor", "index-advisor")
+    db.update_user(user_id, about="index advisor")
+    db.get_user_by_id(user_id)
+    db.get_user_by_username("index-advisor")
+    db.get_user_credentials("index-advisor")
+    db.get_users(pages_info=True)
+    _, _, cursor = db.get_users()
+    db.get_users(cursor=cursor or "WzBd")
+
+    recipe_id = db.create_recipe(title="Борщ", description="Описание", user_id=user_id, tags="суп, обед",
+                                 image=None, ingredients=[{"name": "свекла", "amount": 1, "unit": "PIECE"}],
+                                 recipe_parts=[{"text": "Сварить"}])
+    db.update_recipe(recipe_id, title="Борщ красный", tags="суп, ужин",
+                     ingredients=[{"name": "свекла", "amount": 2, "unit": "PIECE"}],
+                     recipe_parts=[{"text": "Сварить"}])
+    db.get_recipe_by_id(recipe_id)
+    db.get_recipes(pages_info=True)
+    _, _, cursor = db.get_recipes()
+    db.get_recipes(cursor=cursor or "WyIyMDAwLTAxLTAxVDAwOjAwOjAwIiwgMF0")
+    db.get_recipes(user_id=user_id, page=2, pages_info=True)
+    db.get_recipes(title="борщ", tags="суп, ужин", pages_info=True)
+    db.get_tags()
+    db.delete_recipe(recipe_id)
+
+
+def capture(engines, func):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            if (statement, parameters) not in statements:
+                statements.append((statement, parameters))
+
+    for engine in engines:
+        sa.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        func()
+    finally:
+        for engine in engines:
+            sa.event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def classify(detail: str):
+    if not detail.startswith("SCAN ") or "VIRTUAL TABLE" in detail or "CONSTANT ROW" in detail:
+        return None
+    return "INDEX SCAN" if "INDEX" in detail else "FULL SCAN"
+
+
+def report(engine, statements):
+    totals = {"FULL SCAN": 0, "INDEX SCAN": 0}
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = [row.detail for row in
+                    connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()]
+            flags = {classify(detail) for detail in plan} - {None}
+            verdict = "FULL SCAN" if "FULL SCAN" in flags else "INDEX SCAN" if flags else "ok"
+            if verdict in totals:
+                totals[verdict] += 1
+            print(verdict, "|", " ".join(statement.split()))
+            for detail in plan:
+                print(f"    {'!' if classify(detail) else ' '} {detail}")
+    print(f"{len(statements)} queries, {totals['FULL SCAN']} with full table scans, "
+          f"{totals['INDEX SCAN']} with full index scans")
+    return totals["FULL SCAN"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run EXPLAIN QUERY PLAN on every query DatabaseOperations issues and flag full scans. "
+                    "The workload runs on a temporary copy of the database.")
+    parser.add_argument("db_file", nargs="?", default="db.sqlite")
+    parser.add_argument("--strict", action="store_true", help="exit with status 1 if any full table scan is found")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_copy = os.path.join(workdir, "db.sqlite")
+    if os.path.exists(args.db_file):
+        shutil.copy(args.db_file, db_copy)
+
+    from db import migrations
+    from db.db_operations import DatabaseOperations
+    from db.db_session import create_session
+
+    db = DatabaseOperations(db_copy)
+    for _ in migrations.upgrade():
+        pass
+    engines = [create_session().get_bind(), create_session(readonly=True).get_bind()]
+
+    try:
+        full_scans = report(engines[0], capture(engines, lambda: workload(db)))
+    finally:
+        for engine in engines:
+            engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if args.strict and full_scans else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import sqlalchemy as sa
+
+from db import recipe_cards
+from db.db_operations import DatabaseOperations
+from db.db_session import SqlAlchemyBase, create_session
+from db.models.recipe import Recipe
+from db.models.recipe_card import RecipeCard
+from db.models.tag import recipe_tag
+
+
+def backfill_tags():
+    with create_session() as session:
+        tagged = sa.select(recipe_tag.c.recipe_id)
+        recipes = session.query(Recipe).filter(Recipe.tags.isnot(None), Recipe.id.not_in(tagged)).all()
+        changed = 0
+        for recipe in recipes:
+            recipe.tag_list = DatabaseOperations.get_or_create_tags(session, recipe.tags)
+            changed += bool(recipe.tag_list)
+        session.commit()
+        return changed
+
+
+def init_tags(engine):
+    # a database created before tags had their own table gets them filled on the first start
+    with engine.connect() as connection:
+        if connection.execute(sa.select(recipe_tag.c.recipe_id).limit(1)).first():
+            return
+        if not connection.execute(sa.select(Recipe.id).where(Recipe.tags.isnot(None)).limit(1)).first():
+            return
+    backfill_tags()
+
+
+# indexes of earlier versions, the lists are read from the recipe_card indexes now
+DROPPED_INDEXES = {
+    "recipe": ["ix_recipe_created_date_id", "ix_recipe_user_id_created_date"],
+    "recipe_card": ["ix_recipe_card_user_id_created_date"],
+}
+
+
+def drop_indexes():
+    with create_session() as session:
+        inspector = sa.inspect(session.get_bind())
+        dropped = 0
+        for table, names in DROPPED_INDEXES.items():
+            existing = {index["name"] for index in inspector.get_indexes(table)}
+            for name in names:
+                if name in existing:
+                    session.execute(sa.text(f"DROP INDEX {name}"))
+                    dropped += 1
+        session.commit()
+        return dropped
+
+
+def create_indexes():
+    with create_session() as session:
+        bind = session.get_bind()
+        existing = {table: {index["name"] for index in sa.inspect(bind).get_indexes(table)}
+                    for table in SqlAlchemyBase.metadata.tables}
+        created = 0
+        for table in SqlAlchemyBase.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing[table.name]:
+                    index.create(bind)
+                    created += 1
+        return created
+
+
+def rebuild_recipe_cards():
+    with create_session() as session:
+        recipe_cards.rebuild(session.connection())
+        session.commit()
+        return session.query(RecipeCard).count()
+
+
+MIGRATIONS = [
+    ("backfill recipe tags", backfill_tags),
+    ("drop replaced indexes", drop_indexes),
+    ("create missing indexes", create_indexes),
+    ("rebuild recipe cards", rebuild_recipe_cards),
+]
+
+
+def upgrade():
+    for name, migration in MIGRATIONS:
+        yield name, migration()
@@ -1 +1,5 @@
 from . import recipe
+from . import recipe_card
+from . import tag
+from . import user
+from . import version
@@ -25,15 +25,15 @@ class Ingredient(SqlAlchemyBase, SerializerMixin):
     name = Column(String, nullable=False)
     amount = Column(Float, nullable=False)
     unit = Column(Enum(Unit), nullable=False)
-    recipe_id = Column(Integer, ForeignKey("recipe.id"))
+    recipe_id = Column(Integer, ForeignKey("recipe.id"), index=True)
 
 
 class RecipePart(SqlAlchemyBase, SerializerMixin):
     __tablename__ = "recipe_part"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    image = Column(String, nullable=True)
+    image = Column(String, nullable=True, index=True)
     text = Column(String(500), nullable=False)
-    recipe_id = Column(Integer, ForeignKey("recipe.id"))
+    recipe_id = Column(Integer, ForeignKey("recipe.id"), index=True)
 
 
 class Recipe(SqlAlchemyBase, SerializerMixin):
@@ -42,11 +42,14 @@ class Recipe(SqlAlchemyBase, SerializerMixin):
     title = Column(String(100), nullable=False)
     description = Column(String(500), nullable=False)
     tags = Column(String(100), nullable=True)
-    image = Column(String, nullable=True)
+    image = Column(String, nullable=True, index=True)
     created_date = Column(DateTime, default=datetime.datetime.now)
+    updated_date = Column(DateTime, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
 
     # user = relationship("User", back_populates="recipes")
 
     ingredients = relationship("Ingredient", backref="recipe", cascade="all, delete-orphan")
-    recipe_parts = relationship("RecipePart", backref="recipe", cascade="all, delete-orphan")
\ No newline at end of file
+    recipe_parts = relationship("RecipePart", backref="recipe", cascade="all, delete-orphan")
+    tag_list = relationship("Tag", secondary="recipe_tag", back_populates="recipes")
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+
+from ..db_session import SqlAlchemyBase
+
+
+class RecipeCard(SqlAlchemyBase):
+    # read model of the recipe lists (feed, profiles, search): exactly the fields a list shows, with the
+    # author's name copied in, so a page is read without joins; written by db/recipe_cards.py
+    __tablename__ = "recipe_card"
+    __table_args__ = (
+        # covers the feed, its pages are read from the index alone
+        Index("ix_recipe_card_feed", "created_date", "id", "title", "description", "tags", "image", "user_id",
+              "username"),
+        # the same for the profile lists
+        Index("ix_recipe_card_profile", "user_id", "created_date", "id", "title", "description", "tags", "image",
+              "username"),
+    )
+    id = Column(Integer, ForeignKey("recipe.id", ondelete="CASCADE"), primary_key=True, autoincrement=False)
+    title = Column(String(100), nullable=False)
+    description = Column(String(500), nullable=False)
+    tags = Column(String(100), nullable=True)
+    created_date = Column(DateTime)
+    image = Column(String, nullable=True)
+    user_id = Column(Integer, nullable=False)
+    username = Column(String(30), nullable=False)
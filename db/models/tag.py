@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy_serializer import SerializerMixin
+
+from ..db_session import SqlAlchemyBase
+
+recipe_tag = Table(
+    "recipe_tag",
+    SqlAlchemyBase.metadata,
+    Column("tag_id", Integer, ForeignKey("tag.id"), primary_key=True),
+    Column("recipe_id", Integer, ForeignKey("recipe.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_recipe_tag_recipe_id", "recipe_id"),
+)
+
+
+class Tag(SqlAlchemyBase, SerializerMixin):
+    __tablename__ = "tag"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(100), index=True, unique=True, nullable=False)
+
+    recipes = relationship("Recipe", secondary=recipe_tag, back_populates="tag_list")
+
+    @staticmethod
+    def parse(tags: str):
+        names = []
+        for name in (tags or "").split(','):
+            name = " ".join(name.split()).lower()
+            if name and name not in names:
+                names.append(name)
+        return names
@@ -0,0 +1,12 @@
+import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime
+
+from ..db_session import SqlAlchemyBase
+
+
+class DataVersion(SqlAlchemyBase):
+    __tablename__ = "data_version"
+    name = Column(String(30), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_date = Column(DateTime, default=datetime.datetime.now)
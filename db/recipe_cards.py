@@ -0,0 +1,40 @@
+import sqlalchemy as sa
+
+from db.models.recipe import Recipe
+from db.models.recipe_card import RecipeCard
+from db.models.user import User
+
+COLUMNS = ["id", "title", "description", "tags", "created_date", "image", "user_id", "username"]
+
+
+def source():
+    return sa.select(Recipe.id, Recipe.title, Recipe.description, Recipe.tags, Recipe.created_date, Recipe.image,
+                     Recipe.user_id, User.username).join(User, User.id == Recipe.user_id)
+
+
+def refresh(session, recipe_ids):
+    # called in the transaction that wrote the recipes, after a flush
+    delete(session, recipe_ids)
+    session.execute(sa.insert(RecipeCard).from_select(COLUMNS, source().where(Recipe.id.in_(recipe_ids))))
+
+
+def delete(session, recipe_ids):
+    session.execute(sa.delete(RecipeCard).where(RecipeCard.id.in_(recipe_ids)))
+
+
+def rename_user(session, user_id: int, username: str):
+    session.execute(sa.update(RecipeCard).where(RecipeCard.user_id == user_id).values(username=username))
+
+
+def rebuild(connection):
+    connection.execute(sa.delete(RecipeCard.__table__))
+    connection.execute(sa.insert(RecipeCard.__table__).from_select(COLUMNS, source()))
+
+
+def init_cards(engine):
+    # a database created before the read model existed gets it filled on the first start
+    with engine.begin() as connection:
+        if connection.execute(sa.select(RecipeCard.id).limit(1)).first():
+            return
+        if connection.execute(sa.select(Recipe.id).limit(1)).first():
+            rebuild(connection)
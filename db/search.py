@@ -0,0 +1,59 @@
+import sqlalchemy as sa
+
+FTS_TABLE = "recipe_fts"
+
+recipe_fts = sa.table(FTS_TABLE, sa.column("rowid", sa.Integer), sa.column(FTS_TABLE))
+
+CREATE_STATEMENTS = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"title, description, tags, content='recipe', content_rowid='id', tokenize='unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON recipe BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description, tags) "
+    f"VALUES (new.id, new.title, new.description, new.tags); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON recipe BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, tags) "
+    f"VALUES ('delete', old.id, old.title, old.description, old.tags); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON recipe BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, tags) "
+    f"VALUES ('delete', old.id, old.title, old.description, old.tags); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description, tags) "
+    f"VALUES (new.id, new.title, new.description, new.tags); END",
+]
+
+# bm25 column weights for (title, description, tags): a hit in the title counts most
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+
+
+def is_supported(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def init_fts(engine):
+    if not is_supported(engine):
+        return
+    with engine.begin() as connection:
+        exists = connection.execute(sa.text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                    {"name": FTS_TABLE}).first()
+        for statement in CREATE_STATEMENTS:
+            connection.execute(sa.text(statement))
+        if not exists:
+            rebuild(connection)
+
+
+def rebuild(connection):
+    connection.execute(sa.text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def match_expression(title: str = None):
+    words = title.split() if title else []
+    if not words:
+        return None
+    return "{title description} : (" + " AND ".join(_quote(w) + "*" for w in words) + ")"
+
+
+def bm25():
+    return sa.func.bm25(sa.literal_column(FTS_TABLE), *BM25_WEIGHTS)
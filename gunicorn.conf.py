@@ -0,0 +1,31 @@
+import multiprocessing
+import os
+
+wsgi_app = "wsgi:application"
+bind = os.environ.get("WEB_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_WORKERS", multiprocessing.cpu_count()))
+# every thread may hold a database connection: keep WEB_THREADS within DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW
+threads = int(os.environ.get("WEB_THREADS", 4))
+worker_class = "gthread"
+# time for running requests and image jobs to finish after SIGTERM or a reload (SIGHUP)
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+preload_app = True
+
+
+def when_ready(server):
+    import main
+    import wsgi
+
+    main.preload(wsgi.application)
+
+
+def post_fork(server, worker):
+    import main
+
+    main.after_fork()
+
+
+def worker_exit(server, worker):
+    import main
+
+    main.shutdown()
@@ -0,0 +1,77 @@
+import datetime
+import functools
+import hashlib
+import json
+import os
+
+from flask import request, make_response, current_app, g
+from flask_jwt_extended import get_jwt
+
+
+def make_etag(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, default=str, ensure_ascii=False).encode()).hexdigest()
+
+
+def http_date(value: datetime.datetime):
+    if value is None:
+        return None
+    # stored dates are naive local time; HTTP dates are UTC with one second resolution
+    return value.astimezone(datetime.timezone.utc).replace(microsecond=0)
+
+
+@functools.cache
+def templates_version(folder: str) -> str:
+    files = []
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            files.append((path, os.path.getmtime(path)))
+    return make_etag(sorted(files))
+
+
+def is_not_modified(etag: str, last_modified: datetime.datetime) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(version: dict, build, *extra, private: bool = False):
+    if version is None:
+        return make_response(build())
+
+    etag = make_etag(request.full_path, version["version"], *extra)
+    last_modified = http_date(version["last_modified"])
+    if is_not_modified(etag, last_modified):
+        response = make_response("", 304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+        if g.get("image_placeholder"):
+            # rendered before its images were processed, revalidating would keep the placeholder
+            response.cache_control.no_store = True
+            return response
+
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    if private:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config["HTTP_CACHE_MAX_AGE"]
+        response.cache_control.must_revalidate = True
+    return response
+
+
+def conditional_page(version: dict, build):
+    # pages differ per signed-in user (navigation, delete buttons) and change with the templates
+    jwt = get_jwt()
+    identity = [jwt.get("sub"), jwt.get("username"), jwt.get("admin")] if jwt else None
+    templates = templates_version(os.path.join(current_app.root_path, current_app.template_folder))
+    response = conditional(version, build, identity, templates, private=bool(jwt))
+    response.vary.add("Cookie")
+    return response
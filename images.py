@@ -0,0 +1,154 @@
+import math
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from PIL import Image, ImageOps, ExifTags
+
+import metrics
+
+# name: (max width, WebP quality); each variant is resized from the previous, larger one
+VARIANTS = {
+    "full": (1600, 80),
+    "card": (800, 75),
+    "thumb": (400, 70),
+}
+JPEG_QUALITY = 85
+FORMATS = ("JPEG", "PNG", "GIF", "WEBP")
+MAX_PIXELS = 40_000_000
+
+
+def variant_path(path: str, variant: str) -> str:
+    return f"{os.path.splitext(path)[0]}_{variant}.webp"
+
+
+def copy_atomic(source: str, path: str):
+    shutil.copyfile(source, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def save_atomic(image, path: str, format: str, **options):
+    # readers must never see a half-written file
+    image.save(path + ".tmp", format, **options)
+    os.replace(path + ".tmp", path)
+
+
+def validate(path: str, max_pixels: int = MAX_PIXELS):
+    # reads the header only; the single full decode happens in process()
+    try:
+        with Image.open(path) as image:
+            format, width, height = image.format, image.width, image.height
+    except Exception as _:
+        raise Exception("Invalid Image File")
+    if format not in FORMATS:
+        raise Exception("Invalid Image File")
+    if width * height > max_pixels:
+        raise ValueError(f"Image is too large: {width}x{height}, at most {max_pixels} pixels are allowed")
+
+
+def orientation(image) -> int:
+    return image.getexif().get(ExifTags.Base.Orientation, 1)
+
+
+def can_pass_through(image, format: str, width: int) -> bool:
+    # the upload is already what would be written: same format, small enough, upright and without
+    # metadata (re-encoding is what strips EXIF, e.g. GPS position, from uploads)
+    return (image.format == format and image.width <= width and image.mode in ("RGB", "L")
+            and orientation(image) == 1 and "exif" not in image.info)
+
+
+def process(upload: str, target: str) -> float:
+    # returns the seconds spent, measured here because it may run in another process
+    start = time.perf_counter()
+    try:
+        with Image.open(upload) as image:
+            passthrough = {"JPEG": can_pass_through(image, "JPEG", VARIANTS["full"][0]),
+                           "WEBP": can_pass_through(image, "WEBP", VARIANTS["full"][0])}
+
+            # let the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding when the full variant is smaller
+            displayed_width = image.height if orientation(image) in (5, 6, 7, 8) else image.width
+            scale = VARIANTS["full"][0] / displayed_width
+            if image.format == "JPEG" and scale < 1:
+                image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+
+            image = ImageOps.exif_transpose(image)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            for variant, (width, quality) in VARIANTS.items():
+                if image.width > width:
+                    image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+                if variant == "full":
+                    full = image
+                    if passthrough["WEBP"]:
+                        copy_atomic(upload, variant_path(target, variant))
+                        continue
+                save_atomic(image, variant_path(target, variant), "WEBP", quality=quality, method=4)
+            if passthrough["JPEG"]:
+                copy_atomic(upload, target)
+            else:
+                save_atomic(full, target, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    finally:
+        os.remove(upload)
+    return time.perf_counter() - start
+
+
+class ImagePipeline:
+    def __init__(self, workers: int = 2, executor: str = "thread"):
+        self.workers = workers
+        self.executor_type = executor
+        self.executor = None
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+
+    def init_app(self, app):
+        if (self.workers, self.executor_type) != (app.config["IMAGE_WORKERS"], app.config["IMAGE_EXECUTOR"]):
+            # the executor is created on the first upload with these settings; one made with the old ones
+            # finishes its images first
+            self.shutdown()
+        self.workers = app.config["IMAGE_WORKERS"]
+        self.executor_type = app.config["IMAGE_EXECUTOR"]
+
+    def submit(self, upload: str, target: str, callback=None):
+        submitted = time.perf_counter()
+        with self.lock:
+            if self.executor is None:
+                executor = ProcessPoolExecutor if self.executor_type == "process" else ThreadPoolExecutor
+                self.executor = executor(max_workers=self.workers)
+            future = self.executor.submit(process, upload, target)
+            self.pending.add(future)
+        future.add_done_callback(lambda done: self.done(done, callback, submitted))
+        return future
+
+    def done(self, future, callback=None, submitted: float = None):
+        try:
+            if future.exception():
+                print(future.exception(), type(future.exception()))
+                return
+            if submitted is not None:
+                metrics.IMAGE_SECONDS.observe(future.result())
+                metrics.IMAGE_QUEUE_SECONDS.observe(max(0.0, time.perf_counter() - submitted - future.result()))
+            if callback:
+                callback(future.result())
+        except Exception as error:
+            print(error, type(error))
+        finally:
+            with self.lock:
+                self.pending.discard(future)
+                self.idle.notify_all()
+
+    def wait(self):
+        # returns once every submitted image is processed and its callback has run
+        with self.lock:
+            self.idle.wait_for(lambda: not self.pending)
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+pipeline = ImagePipeline()
+
@@ -1,42 +1,130 @@
-import base64
 import os
 from datetime import timedelta
 
-import requests
-from flask import Flask, render_template, request, redirect, flash, get_flashed_messages, abort
+from flask import Flask, Blueprint, render_template, request, redirect, flash, get_flashed_messages, abort, g, \
+    current_app
 from flask_jwt_extended import JWTManager, set_access_cookies, set_refresh_cookies, get_jwt, jwt_required, \
-    unset_jwt_cookies, verify_jwt_in_request
+    unset_jwt_cookies, verify_jwt_in_request, get_jwt_identity
+from sqlalchemy.orm import configure_mappers
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 import api
-from db.db_operations import DatabaseOperations
+import auth
+import cli
+import images
+import metrics
+import profiling
+from api_client import create_api_client
+from db.db_session import dispose_engines
 from forms.login import LoginForm
 from forms.recipe import RecipeForm
 from forms.register import RegisterForm
+from http_cache import conditional_page, templates_version
 from swagger import swagger_ui_blueprint, SWAGGER_URL
 
-db = DatabaseOperations("db.sqlite")
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'my-secret-key')
-app.config['UPLOAD_FOLDER'] = 'static/uploads/'
-
-app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'dev-secret-key')
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=2)
-app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
-app.config['JWT_COOKIE_CSRF_PROTECT'] = False
-app.config['JWT_TOKEN_LOCATION'] = ['cookies']
+pages = Blueprint("pages", __name__)
+jwt = JWTManager()
+# the API client of the app handling the request, see create_app()
+api_client = LocalProxy(lambda: current_app.extensions["api_client"])
+
+
+def create_app(config: dict = None):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'my-secret-key')
+    app.config['UPLOAD_FOLDER'] = 'static/uploads/'
+
+    app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'dev-secret-key')
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=2)
+    app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
+    app.config['JWT_COOKIE_CSRF_PROTECT'] = False
+    app.config['JWT_TOKEN_LOCATION'] = ['cookies']
+    app.config['JWT_RENEW_WINDOW'] = int(os.environ.get('JWT_RENEW_WINDOW', 6 * 60 * 60))
+    app.config['JWT_DENYLIST_TYPE'] = os.environ.get('JWT_DENYLIST_TYPE', 'memory')
+
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 0))
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+    app.config['RATE_LIMIT_TYPE'] = os.environ.get('RATE_LIMIT_TYPE', 'memory')
+    app.config['LOGIN_RATE_USERNAME'] = os.environ.get('LOGIN_RATE_USERNAME', '10/300')
+    app.config['LOGIN_RATE_IP'] = os.environ.get('LOGIN_RATE_IP', '30/60')
+    app.config['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', 0))
+
+    app.config['API_MODE'] = os.environ.get('API_MODE', 'local')
+    app.config['API_URL'] = os.environ.get('API_URL', 'http://localhost:5000/api')
+
+    app.config['DATABASE_URL'] = os.environ.get('DATABASE_URL', 'sqlite:///db.sqlite')
+    app.config['DATABASE_POOL_SIZE'] = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    app.config['DATABASE_MAX_OVERFLOW'] = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+    app.config['DATABASE_CACHE_KB'] = int(os.environ.get('DATABASE_CACHE_KB', 2048))
+
+    app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'lru')
+    app.config['CACHE_SIZE'] = int(os.environ.get('CACHE_SIZE', 1024))
+    app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 300))
+    app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    app.config['HTTP_CACHE_MAX_AGE'] = int(os.environ.get('HTTP_CACHE_MAX_AGE', 0))
+
+    app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+    app.config['IMAGE_EXECUTOR'] = os.environ.get('IMAGE_EXECUTOR', 'thread')
+    app.config['IMAGE_MAX_BYTES'] = int(os.environ.get('IMAGE_MAX_BYTES', 20 * 1024 * 1024))
+    app.config['IMAGE_MAX_PIXELS'] = int(os.environ.get('IMAGE_MAX_PIXELS', 40_000_000))
+
+    app.config['STORAGE_TYPE'] = os.environ.get('STORAGE_TYPE', 'local')
+    app.config['S3_BUCKET'] = os.environ.get('S3_BUCKET', 'cookbook')
+    app.config['S3_ENDPOINT_URL'] = os.environ.get('S3_ENDPOINT_URL')
+    app.config['S3_REGION'] = os.environ.get('S3_REGION')
+    app.config['S3_URL_EXPIRES'] = int(os.environ.get('S3_URL_EXPIRES', 3600))
+
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+    app.config['SLOW_REQUEST_SECONDS'] = float(os.environ.get('SLOW_REQUEST_SECONDS', 0))
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_FORMAT'] = os.environ.get('PROFILE_FORMAT', 'pstats')
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+    app.config['PROFILE_KEEP'] = int(os.environ.get('PROFILE_KEEP', 100))
+    app.config['PROFILE_TOKEN_MAX_AGE'] = int(os.environ.get('PROFILE_TOKEN_MAX_AGE', 3600))
+    app.config.update(config or {})
+    if app.config['TRUSTED_PROXIES']:
+        # the client address (limited per address on sign-in) and scheme from the X-Forwarded-* headers
+        # set by this many reverse proxies; without one in front the headers would be the client's to forge
+        hops = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops, x_port=hops)
+
+    # the services are per process: a later app with other settings rebuilds the engines and caches and
+    # shuts down the executors it replaces
+    api.services.init_app(app)
+    images.pipeline.init_app(app)
+    app.jinja_env.globals.update(image_url=api.services.storage.image_url,
+                                 image_srcset=api.services.storage.image_srcset)
+    profiling.profiler.init_app(app)
+    metrics.init_app(app)
+    jwt.init_app(app)
+    auth.init_app(app, jwt)
+    app.extensions["api_client"] = create_api_client(app.config)
+
+    app.register_blueprint(pages)
+    app.register_blueprint(api.blueprint, url_prefix="/api", config=app.config)
+    app.register_blueprint(swagger_ui_blueprint, url_prefix=SWAGGER_URL)
 
-jwt = JWTManager(app)
+    app.cli.add_command(cli.rebuild_search_index)
+    app.cli.add_command(cli.migrate)
+    app.cli.add_command(cli.process_images)
+    app.cli.add_command(cli.collect_garbage)
+    app.cli.add_command(cli.import_recipes)
+    app.cli.add_command(cli.export_recipes)
+    app.cli.add_command(cli.profile_token)
+    return app
 
 
 @jwt.expired_token_loader
 def expired_token_callback(jwt_header, jwt_payload):
-    response = requests.get("http://localhost:5000/api/refresh", cookies=request.cookies).json()
-    if "access_token" not in response:
+    access_token = auth.refresh_from_cookie()
+    if not access_token:
         return redirect("/logout")
     else:
-        re = redirect(request.path)
-        set_access_cookies(re, response.get("access_token"))
+        # 307 repeats a form submission with its body
+        re = redirect(request.full_path if request.query_string else request.path,
+                      302 if request.method == "GET" else 307)
+        set_access_cookies(re, access_token)
         return re
 
 
@@ -45,41 +133,49 @@ def handle_unauthorized_error(callback):
     return redirect("/login")
 
 
-@app.errorhandler(403)
+@jwt.revoked_token_loader
+def revoked_token_callback(jwt_header, jwt_payload):
+    return redirect("/logout")
+
+
+@pages.app_errorhandler(403)
 def page_not_found(error):
     return render_template('error.html', code="403", text="Доступ запрещен")
 
 
-@app.errorhandler(404)
+@pages.app_errorhandler(404)
 def page_not_found(error):
     return render_template('error.html', code="404", text="Страница не найдена")
 
 
-@app.errorhandler(500)
+@pages.app_errorhandler(500)
 def page_not_found(error):
     return render_template('error.html', code="500", text="Произошла непредвиденная ошибка на сервере")
 
 
-@app.route("/", methods=["GET"])
-@app.route("/index", methods=["GET"])
+@pages.route("/", methods=["GET"])
+@pages.route("/index", methods=["GET"])
 def index():
     verify_jwt_in_request(optional=True)
     title = "Главная"
     page = request.args.get("page", 1, type=int)
-    response = requests.get(f"http://localhost:5000/api/recipes?page={page}&pages_info=true").json()
-    recipes_list = response.get("recipes")
-    pages = response.get("pages")
-    return render_template("recipe_list.html", title=title, recipes=recipes_list,
-                           page=page, pages=pages, jwt=get_jwt())
+
+    def render():
+        response = api_client.get_recipes(page=page, pages_info=True)
+        recipes_list = response.get("recipes")
+        pages = response.get("pages")
+        return render_template("recipe_list.html", title=title, recipes=recipes_list,
+                               page=page, pages=pages, jwt=get_jwt())
+    return conditional_page(api_client.get_list_version("recipes"), render)
 
 
-@app.route("/register", methods=["GET", "POST"])
+@pages.route("/register", methods=["GET", "POST"])
 @jwt_required(optional=True)
 def register():
     title = "Регистрация"
     form = RegisterForm()
     if form.validate_on_submit():
-        response = requests.post("http://localhost:5000/api/register", json=dict(request.form)).json()
+        response = api_client.register(form.username.data, form.password.data, form.about.data)
         if "success" in response:
             flash("Аккаунт создан")
             return redirect("/login")
@@ -93,7 +189,7 @@ def register():
     return render_template("register.html", title=title, form=form, jwt=get_jwt())
 
 
-@app.route("/login", methods=["GET", "POST"])
+@pages.route("/login", methods=["GET", "POST"])
 @jwt_required(optional=True)
 def login():
     if get_jwt():
@@ -101,7 +197,7 @@ def login():
     title = "Вход"
     form = LoginForm()
     if request.form:
-        response = requests.post("http://localhost:5000/api/login", json=dict(request.form)).json()
+        response = api_client.login(request.form.get("username"), request.form.get("password"))
         if "access_token" in response:
             re = redirect("/")
             set_access_cookies(re, response.get("access_token"))
@@ -117,19 +213,13 @@ def login():
     return render_template("login.html", title=title, form=form, jwt=get_jwt())
 
 
-@app.route("/new_recipe", methods=["GET", "POST"])
+@pages.route("/new_recipe", methods=["GET", "POST"])
 @jwt_required()
 def new_recipe():
     title = "Новый рецепт"
     form = RecipeForm()
     if form.validate_on_submit():
-        form.main_image.data = base64.b64encode(form.main_image.data.read()).decode('utf-8')
-        for part in form.recipe_parts:
-            data = part.step_image.data
-            if data:
-                part.step_image.data = base64.b64encode(data.read()).decode('utf-8')
-        response = requests.post("http://localhost:5000/api/recipes", cookies=request.cookies, json=form.data).json()
-        print(response)
+        response = api_client.create_recipe(form.data, get_jwt_identity())
         if "id" in response:
             return redirect(f"/recipes/{response.get('id')}")
         else:
@@ -137,7 +227,7 @@ def new_recipe():
     return render_template("recipe_edit.html", title=title, jwt=get_jwt(), form=form)
 
 
-# @app.route("/recipes/<int:recipe_id>/edit", methods=["GET", "PUT"])
+# @pages.route("/recipes/<int:recipe_id>/edit", methods=["GET", "PUT"])
 # @jwt_required()
 # def edit_recipe(recipe_id):
 #     title = "Редактирование рецепта"
@@ -152,20 +242,22 @@ def new_recipe():
 #     else:
 #         abort(404)
 
-@app.route("/recipes/<int:recipe_id>", methods=["GET"])
+@pages.route("/recipes/<int:recipe_id>", methods=["GET"])
 @jwt_required(optional=True)
 def recipe(recipe_id):
-    recipe_dict = requests.get(f"http://localhost:5000/api/recipes/{recipe_id}").json()
-    if "error" in recipe_dict:
-        abort(404)
-    return render_template("recipe.html", title=recipe_dict.get("title"),
-                           recipe=recipe_dict, jwt=get_jwt())
+    def render():
+        recipe_dict = api_client.get_recipe(recipe_id)
+        if "error" in recipe_dict:
+            abort(404)
+        return render_template("recipe.html", title=recipe_dict.get("title"),
+                               recipe=recipe_dict, jwt=get_jwt())
+    return conditional_page(api_client.get_recipe_version(recipe_id), render)
 
 
-@app.route("/recipes/<int:recipe_id>/delete")
+@pages.route("/recipes/<int:recipe_id>/delete")
 @jwt_required()
 def delete_recipe(recipe_id):
-    response = requests.delete(f"http://localhost:5000/api/recipes/{recipe_id}", cookies=request.cookies).json()
+    response = api_client.delete_recipe(recipe_id, get_jwt_identity(), int(get_jwt().get("admin")))
     if "success" in response:
         return redirect("/")
     elif "error" in response:
@@ -179,54 +271,92 @@ def delete_recipe(recipe_id):
         abort(500)
 
 
-@app.route("/users/<int:user_id>", methods=["GET"])
+@pages.route("/users/<int:user_id>", methods=["GET"])
 @jwt_required(optional=True)
 def user(user_id):
     page = request.args.get("page", 1, type=int)
-    user_dict = requests.get(f"http://localhost:5000/api/users/{user_id}?page={page}").json()
-    if "error" in user_dict:
-        abort(404)
-    response = requests.get(f"http://localhost:5000/api/recipes?user_id={user_id}&page={page}&pages_info=true").json()
-    recipes_list = response.get("recipes")
-    pages = response.get("pages")
-    if recipes_list or page == 1:
-        return render_template("profile.html", title=user_dict.get("username"),
-                               recipes=recipes_list, user=user_dict, page=page, pages=pages, jwt=get_jwt())
-    else:
-        abort(404)
+
+    def render():
+        user_dict = api_client.get_user(user_id)
+        if "error" in user_dict:
+            abort(404)
+        response = api_client.get_recipes(user_id=user_id, page=page, pages_info=True)
+        recipes_list = response.get("recipes")
+        pages = response.get("pages")
+        if recipes_list or page == 1:
+            return render_template("profile.html", title=user_dict.get("username"),
+                                   recipes=recipes_list, user=user_dict, page=page, pages=pages, jwt=get_jwt())
+        else:
+            abort(404)
+    return conditional_page(api_client.get_list_version("users", "recipes"), render)
 
 
-@app.route("/search", methods=["GET"])
+@pages.route("/search", methods=["GET"])
 @jwt_required(optional=True)
 def search():
     search_title = request.args.get("title", None)
     search_tags = request.args.get("tags", None)
     page = request.args.get("page", 1, type=int)
-    response = requests.get(f"http://localhost:5000/api/recipes"
-                            f"?page={page}"
-                            f"{('&title=' + search_title.strip()) if search_title else ''}"
-                            f"{('&tags=' + search_tags.strip()) if search_tags else ''}"
-                            f"&pages_info=true").json()
-    recipes_list = response.get("recipes")
-    pages = response.get("pages")
-    if recipes_list or page == 1:
-        return render_template("search.html", title=search_title, recipes=recipes_list,
-                               page=page, pages=pages, jwt=get_jwt())
-    else:
+
+    def render():
+        response = api_client.get_recipes(title=search_title.strip() if search_title else None,
+                                          tags=search_tags.strip() if search_tags else None,
+                                          page=page, pages_info=True)
+        recipes_list = response.get("recipes")
+        pages = response.get("pages")
+        if recipes_list or page == 1:
+            return render_template("search.html", title=search_title, recipes=recipes_list,
+                                   page=page, pages=pages, jwt=get_jwt())
+        else:
+            abort(404)
+    return conditional_page(api_client.get_list_version("recipes"), render)
+
+
+@pages.route("/images/<path:key>")
+def image(key):
+    storage = api.services.storage
+    if not key.startswith(storage.folder):
         abort(404)
+    variant = request.args.get("variant")
+    response = redirect(storage.redirect_url(key, variant if variant in images.VARIANTS else None))
+    if g.get("image_placeholder"):
+        response.cache_control.no_store = True
+    else:
+        # presigned URLs expire, the redirect must not outlive them
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['S3_URL_EXPIRES'] // 2
+    return response
 
 
-@app.route("/logout")
+@pages.route("/logout")
 def logout():
+    auth.revoke_cookies()
     re = redirect("/")
     unset_jwt_cookies(re)
     return re
 
 
+def preload(app):
+    # done once in the master process before the workers are forked, the workers share it copy-on-write
+    configure_mappers()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    templates_version(os.path.join(app.root_path, app.template_folder))
+
+
+def after_fork():
+    # pooled connections opened by the master process must not be shared with the workers
+    dispose_engines(close=False)
+
+
+def shutdown():
+    # lets the images in the pipeline finish before the worker exits
+    images.pipeline.shutdown()
+    dispose_engines(close=True)
+
+
 def main():
-    app.register_blueprint(api.blueprint, url_prefix="/api", config=app.config)
-    app.register_blueprint(swagger_ui_blueprint, url_prefix=SWAGGER_URL)
-    app.run()
+    create_app().run()
 
 
 if __name__ == '__main__':
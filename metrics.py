@@ -0,0 +1,201 @@
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, request
+from flask.signals import before_render_template, template_rendered
+
+from db import db_session
+
+# seconds; the usual Prometheus defaults, finer ones for single SQL statements
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+IMAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# statements kept per request for the slow request log
+MAX_STATEMENTS = 200
+
+log = logging.getLogger(__name__)
+registry = []
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in values)
+    labels = [f'{name}="{value}"' for name, value in zip(names, escaped)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            values = list(self.values.items())
+        for labels, value in sorted(values):
+            yield f"{self.name}{format_labels(self.labels, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self.series = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self.series.items()]
+        for labels, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{format_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}"
+
+
+REQUESTS = Counter("cookbook_http_requests_total", "HTTP requests by endpoint, method and status",
+                   ("endpoint", "method", "status"))
+REQUEST_SECONDS = Histogram("cookbook_http_request_duration_seconds", "Time to build the response",
+                            ("endpoint", "method"))
+REQUEST_QUERIES = Histogram("cookbook_http_request_sql_queries", "SQL statements per request", ("endpoint",),
+                            QUERY_COUNT_BUCKETS)
+SQL_QUERIES = Counter("cookbook_sql_queries_total", "SQL statements by the endpoint that issued them",
+                      ("endpoint",))
+SQL_SECONDS = Histogram("cookbook_sql_query_duration_seconds", "Time of single SQL statements", ("endpoint",),
+                        SQL_BUCKETS)
+TEMPLATE_SECONDS = Histogram("cookbook_template_render_seconds", "Time to render a page template", ("template",))
+IMAGE_SECONDS = Histogram("cookbook_image_processing_seconds", "Time to create the variants of an upload",
+                          buckets=IMAGE_BUCKETS)
+IMAGE_QUEUE_SECONDS = Histogram("cookbook_image_queue_seconds", "Time an upload waited for an image worker",
+                                buckets=IMAGE_BUCKETS)
+
+
+class RequestStats:
+    def __init__(self, endpoint: str, statements: bool = False):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = [] if statements else None
+        self.finished = False
+
+
+current = contextvars.ContextVar("request_stats", default=None)
+renders = threading.local()
+slow_seconds = 0.0
+
+
+def begin(endpoint: str) -> RequestStats:
+    stats = RequestStats(endpoint, statements=bool(slow_seconds))
+    current.set(stats)
+    return stats
+
+
+def finish(stats: RequestStats, method: str, status: int, path: str):
+    if stats.finished:
+        return
+    stats.finished = True
+    seconds = time.perf_counter() - stats.start
+    REQUESTS.inc(stats.endpoint, method, str(status))
+    REQUEST_SECONDS.observe(seconds, stats.endpoint, method)
+    REQUEST_QUERIES.observe(stats.queries, stats.endpoint)
+    if slow_seconds and seconds >= slow_seconds:
+        lines = [f"Slow request: {method} {path} {status} {seconds:.3f} s, "
+                 f"{stats.queries} SQL statements {stats.sql_seconds:.3f} s"]
+        lines += [f"  {statement_seconds * 1000:8.1f} ms  {' '.join(statement.split())}"
+                  for statement_seconds, statement in stats.statements]
+        if stats.queries > len(stats.statements):
+            lines.append(f"  ... {stats.queries - len(stats.statements)} more")
+        log.warning("\n".join(lines))
+
+
+def record_query(statement: str, seconds: float):
+    stats = current.get()
+    endpoint = stats.endpoint if stats else "none"
+    SQL_QUERIES.inc(endpoint)
+    SQL_SECONDS.observe(seconds, endpoint)
+    if stats:
+        stats.queries += 1
+        stats.sql_seconds += seconds
+        if stats.statements is not None and len(stats.statements) < MAX_STATEMENTS:
+            stats.statements.append((seconds, statement))
+
+
+def render() -> str:
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+def init_app(app):
+    global slow_seconds
+
+    if not app.config["METRICS_ENABLED"]:
+        return
+    slow_seconds = app.config["SLOW_REQUEST_SECONDS"]
+    if record_query not in db_session.query_listeners:
+        db_session.query_listeners.append(record_query)
+
+    @app.before_request
+    def start_request():
+        begin(request.endpoint or "unmatched")
+
+    @app.after_request
+    def finish_request(response):
+        stats = current.get()
+        if stats:
+            finish(stats, request.method, response.status_code, request.full_path.rstrip("?"))
+        return response
+
+    @app.teardown_request
+    def end_request(error=None):
+        # after_request is skipped when the response could not be built
+        stats = current.get()
+        if stats:
+            finish(stats, request.method, 500, request.full_path.rstrip("?"))
+        current.set(None)
+
+    before_render_template.connect(start_render, app)
+    template_rendered.connect(finish_render, app)
+    app.add_url_rule("/metrics", "metrics", lambda: Response(render(), mimetype="text/plain; version=0.0.4"))
+
+
+def start_render(sender, template, context, **extra):
+    renders.__dict__.setdefault("starts", []).append(time.perf_counter())
+
+
+def finish_render(sender, template, context, **extra):
+    starts = renders.__dict__.get("starts")
+    if starts:
+        TEMPLATE_SECONDS.observe(time.perf_counter() - starts.pop(), template.name or "string")
@@ -0,0 +1,101 @@
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from ratelimit import RateLimitExceeded
+
+# werkzeug methods ("scrypt:32768:8:1", "pbkdf2:sha256:1000000") or "argon2:<time cost>:<memory KiB>:<lanes>"
+# (needs argon2-cffi); hashes made with any other method or cost are replaced on the next sign-in
+METHOD = "scrypt:32768:8:1"
+
+
+class PasswordHasher:
+    def __init__(self, method: str = METHOD, workers: int = 0, queue: int = 16):
+        self.executor = None
+        self.configure(method, workers, queue)
+
+    def init_app(self, app):
+        self.configure(app.config["PASSWORD_HASH_METHOD"], app.config["PASSWORD_HASH_WORKERS"],
+                       app.config["PASSWORD_HASH_QUEUE"])
+
+    def configure(self, method: str, workers: int = 0, queue: int = 16):
+        self.method = method
+        self.workers = workers
+        self.queue = queue
+        self.argon2 = None
+        if method.startswith("argon2"):
+            from argon2 import PasswordHasher as Argon2Hasher
+
+            time_cost, memory_cost, lanes = (int(value) for value in method.split(":")[1:])
+            self.argon2 = Argon2Hasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=lanes)
+        self._prefix = None
+        self._dummy = None
+        # hashing is CPU bound: with workers, at most that many hashes run at once and at most
+        # workers + queue requests wait for one, the others are turned away
+        if self.executor:
+            # hashes already submitted still finish
+            self.executor.shutdown(wait=False)
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+        self.slots = threading.BoundedSemaphore(workers + queue) if workers else None
+
+    def run(self, function, *args):
+        if not self.executor:
+            return function(*args)
+        if not self.slots.acquire(blocking=False):
+            raise RateLimitExceeded(1)
+        try:
+            return self.executor.submit(function, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password: str) -> str:
+        if self.argon2:
+            return self.run(self.argon2.hash, password)
+        return self.run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        if not password_hash:
+            # unknown users cost as much as wrong passwords, so the timing does not reveal who exists
+            self.run(self._verify, self.dummy, password)
+            return False
+        return self.run(self._verify, password_hash, password)
+
+    def _verify(self, password_hash: str, password: str) -> bool:
+        if password_hash.startswith("$argon2"):
+            from argon2.exceptions import VerificationError, InvalidHashError
+
+            try:
+                return self.argon2_hasher().verify(password_hash, password)
+            except (VerificationError, InvalidHashError):
+                return False
+        return check_password_hash(password_hash, password)
+
+    def argon2_hasher(self):
+        if self.argon2:
+            return self.argon2
+        from argon2 import PasswordHasher as Argon2Hasher
+
+        return Argon2Hasher()
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        if self.argon2:
+            return not password_hash.startswith("$argon2") or self.argon2.check_needs_rehash(password_hash)
+        return password_hash.split("$", 1)[0] != self.prefix
+
+    @property
+    def prefix(self) -> str:
+        # werkzeug fills in default costs ("pbkdf2:sha256" -> "pbkdf2:sha256:1000000"), compare what it stores
+        if self._prefix is None:
+            self._prefix = generate_password_hash("", self.method).split("$", 1)[0]
+        return self._prefix
+
+    @property
+    def dummy(self) -> str:
+        if self._dummy is None:
+            self._dummy = self.hash(secrets.token_hex(16))
+        return self._dummy
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,135 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from flask import request, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+HEADER = "X-Profile"
+# pstats files open with `python -m pstats` or snakeviz; speedscope files (needs pyinstrument) in speedscope.app
+EXTENSIONS = {"pstats": ".prof", "speedscope": ".speedscope.json"}
+
+
+class Profiler:
+    def __init__(self, directory: str = "profiles", sample_rate: float = 0, format: str = "pstats", keep: int = 100):
+        self.directory = os.path.abspath(directory)
+        self.sample_rate = sample_rate
+        self.format = format
+        self.keep = keep
+        self.max_age = 3600
+        self.serializer = None
+        # one request is profiled at a time, the others of the sample are skipped
+        self.busy = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = os.path.abspath(app.config["PROFILE_DIR"])
+        self.sample_rate = app.config["PROFILE_SAMPLE_RATE"]
+        self.format = app.config["PROFILE_FORMAT"]
+        self.keep = app.config["PROFILE_KEEP"]
+        self.max_age = app.config["PROFILE_TOKEN_MAX_AGE"]
+        if self.format not in EXTENSIONS:
+            raise ValueError(f"Unknown profile format: {self.format}")
+        self.serializer = URLSafeTimedSerializer(app.config["SECRET_KEY"], salt="profile")
+        app.before_request(self.start)
+        app.after_request(self.stop)
+        app.teardown_request(self.discard)
+
+    def token(self) -> str:
+        # a header value that profiles every request carrying it until it expires
+        return self.serializer.dumps("profile")
+
+    def requested(self) -> bool:
+        token = request.headers.get(HEADER)
+        if not token or not self.serializer:
+            return False
+        try:
+            return self.serializer.loads(token, max_age=self.max_age) == "profile"
+        except BadSignature:
+            return False
+
+    def start(self):
+        if not (self.sample_rate and random.random() < self.sample_rate) and not self.requested():
+            return
+        if not self.busy.acquire(blocking=False):
+            return
+        if self.format == "speedscope":
+            from pyinstrument import Profiler as Sampler
+
+            profile = Sampler(async_mode="disabled")
+            profile.start()
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+        g.profile = (profile, time.perf_counter())
+
+    def stop(self, response):
+        profile, start = g.pop("profile", (None, None))
+        if profile is None:
+            return response
+        try:
+            self.finish(profile)
+            name = self.save(profile, time.perf_counter() - start)
+            response.headers[f"{HEADER}-Name"] = name
+        finally:
+            self.busy.release()
+        return response
+
+    def discard(self, error=None):
+        # after_request is skipped when the response could not be built
+        profile, _ = g.pop("profile", (None, None))
+        if profile is not None:
+            self.finish(profile)
+            self.busy.release()
+
+    def finish(self, profile):
+        if isinstance(profile, cProfile.Profile):
+            profile.disable()
+        else:
+            profile.stop()
+
+    def save(self, profile, seconds: float) -> str:
+        endpoint = (request.endpoint or "unmatched").replace(".", "-")
+        name = (f"{datetime.now():%Y%m%d-%H%M%S-%f}-{request.method}-{endpoint}-{round(seconds * 1000)}ms"
+                f"{EXTENSIONS[self.format]}")
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        if isinstance(profile, cProfile.Profile):
+            profile.dump_stats(path)
+        else:
+            from pyinstrument.renderers import SpeedscopeRenderer
+
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(profile.output(SpeedscopeRenderer()))
+        self.rotate()
+        return name
+
+    def rotate(self):
+        for name in self.names()[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def names(self) -> list:
+        # newest first; the names start with the time
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name for name in os.listdir(self.directory) if name.endswith(tuple(EXTENSIONS.values()))),
+                      reverse=True)
+
+    def list(self) -> list:
+        profiles = []
+        for name in self.names():
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            profiles.append({"name": name, "size": stat.st_size,
+                             "created_date": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds")})
+        return profiles
+
+
+profiler = Profiler()
@@ -0,0 +1,103 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# a token bucket per key in one Redis hash: refilled by elapsed time, cost tokens taken per request
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = math.min(capacity, (tonumber(bucket[1]) or capacity) + (now - (tonumber(bucket[2]) or now)) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - cost
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many attempts, try again in {retry_after} s")
+        self.retry_after = retry_after
+
+
+def parse_rate(rate: str):
+    # "10/300": up to 10 requests at once, refilled at 10 per 300 seconds
+    count, seconds = rate.split("/")
+    return int(count), int(count) / float(seconds)
+
+
+class MemoryBuckets:
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, rate: float, cost: int = 1) -> float:
+        # seconds until a token is available, 0 when cost tokens were taken (none for cost 0)
+        with self._lock:
+            now = time.monotonic()
+            tokens, stamp = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= cost
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class RedisBuckets:
+    def __init__(self, client=None, url: str = None, prefix: str = "cookbook:rate:"):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.script = client.register_script(TAKE_SCRIPT)
+
+    def take(self, key: str, capacity: int, rate: float, cost: int = 1) -> float:
+        return float(self.script(keys=[self.prefix + key], args=[capacity, rate, cost]))
+
+
+class RateLimiter:
+    def __init__(self, buckets=None, rules: dict = None):
+        self.buckets = buckets or MemoryBuckets()
+        self.rules = rules or {}
+
+    def init_app(self, app):
+        if app.config.get("RATE_LIMIT_TYPE", "memory") == "redis":
+            self.buckets = RedisBuckets(url=app.config["CACHE_REDIS_URL"])
+        else:
+            self.buckets = MemoryBuckets()
+        self.rules = {"login:username": parse_rate(app.config["LOGIN_RATE_USERNAME"]),
+                      "login:ip": parse_rate(app.config["LOGIN_RATE_IP"])}
+
+    def check(self, rule: str, key: str, cost: int = 1):
+        # cost 0 only checks that the bucket is not empty, for limits that count failures
+        if rule not in self.rules or key is None:
+            return
+        wait = self.buckets.take(f"{rule}:{key}", *self.rules[rule], cost)
+        if wait:
+            raise RateLimitExceeded(math.ceil(wait))
+
+    def hit(self, rule: str, key: str):
+        if rule in self.rules and key is not None:
+            self.buckets.take(f"{rule}:{key}", *self.rules[rule])
+
+
+limiter = RateLimiter()
@@ -0,0 +1,278 @@
+import base64
+import datetime
+import json
+import time
+from io import BytesIO
+
+import jwt.exceptions
+import sqlalchemy.exc
+from flask_jwt_extended import create_access_token, create_refresh_token
+
+from db.cache import CachedDatabaseOperations
+from db.db_operations import BULK_CHUNK_SIZE, parse_unit
+from db.models.recipe import Recipe
+from passwords import hasher
+from profiling import profiler
+from ratelimit import limiter, RateLimitExceeded
+from storage import LocalStorage, create_storage
+
+storage = LocalStorage()
+db = CachedDatabaseOperations(storage=storage)
+
+
+def init_app(app):
+    global storage
+    storage = create_storage(app.config)
+    db.storage = storage
+    db.init_app(app)
+    hasher.init_app(app)
+    limiter.init_app(app)
+
+
+def error_response(error: Exception):
+    if isinstance(error, sqlalchemy.exc.SQLAlchemyError):
+        return {"error": "Bad Request", "type": str(type(error))}, 400
+    if isinstance(error, jwt.exceptions.ExpiredSignatureError):
+        return {"error": "Expired Signature"}, 401
+    if isinstance(error, ValueError):
+        return {"error": str(error)}, 400
+    if isinstance(error, RateLimitExceeded):
+        return {"error": str(error), "retry_after": error.retry_after}, 429
+    return {"error": "Internal Server Error" if not str(error) else str(error), "type": str(type(error))}, 500
+
+
+def login(username: str, password: str, ip: str = None):
+    # limits are checked before any hashing is done; every attempt counts per address, only failed ones per
+    # username, so signing in does not use up the user's own attempts
+    limiter.check("login:ip", ip)
+    limiter.check("login:username", username, cost=0)
+    user = db.get_user_credentials(username)
+    if hasher.verify(user and user.get("password"), password):
+        if hasher.needs_rehash(user.get("password")):
+            db.set_password_hash(user.get("id"), hasher.hash(password))
+        additional_claims = {"username": username, "admin": int(user.get("admin"))}
+        access_token = create_access_token(identity=str(user.get("id")), additional_claims=additional_claims,
+                                           fresh=True)
+        refresh_token = create_refresh_token(identity=str(user.get("id")), additional_claims=additional_claims)
+        return {
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+        }
+    else:
+        limiter.hit("login:username", username)
+        return {"error": "Wrong login or password"}
+
+
+def register(username: str, password: str, about: str = None):
+    user_id = db.create_user(username, password, about)
+    return {"success": "OK", "id": user_id}
+
+
+def refresh(token: dict):
+    additional_claims = {"username": token.get("username"), "admin": token.get("admin")}
+    new_token = create_access_token(identity=token.get("sub"), additional_claims=additional_claims)
+    return {"access_token": new_token}
+
+
+def create_recipe(data: dict, user_id: int):
+    # images are base64 strings (JSON API), file objects (multipart uploads, local forms)
+    # or keys of objects uploaded directly to the storage (*_image_key)
+    main_image_filename = save_image(data.get("main_image"), data.get("main_image_key"))
+
+    ingredients_list = []
+    for ingredient in data.get("ingredients"):
+        ingredients_list.append({
+            "name": ingredient.get("name"),
+            "amount": ingredient.get("amount"),
+            "unit": ingredient.get("unit")
+        })
+    recipe_parts_list = []
+    for part in data.get("recipe_parts"):
+        step_image_filename = None
+        if part.get("step_image") or part.get("step_image_key"):
+            step_image_filename = save_image(part.get("step_image"), part.get("step_image_key"))
+
+        recipe_parts_list.append({
+            "text": part.get("text"),
+            "image": step_image_filename
+        })
+
+    recipe_id = db.create_recipe(
+        title=data.get("title"),
+        description=data.get("description"),
+        user_id=user_id,
+        tags=data.get("tags"),
+        image=main_image_filename,
+        ingredients=ingredients_list,
+        recipe_parts=recipe_parts_list
+    )
+    return {"success": "OK", "id": recipe_id}
+
+
+def import_recipes(lines, user_id: int, chunk_size: int = BULK_CHUNK_SIZE):
+    start = time.perf_counter()
+    count = db.import_recipes(parse_recipe_lines(lines), user_id, chunk_size)
+    seconds = time.perf_counter() - start
+    return {"success": "OK", "imported": count, "seconds": round(seconds, 3),
+            "recipes_per_second": round(count / seconds, 1) if seconds else None}
+
+
+def parse_recipe_lines(lines):
+    # NDJSON in the export format; ids, authors and image files are not copied, image keys must
+    # already be in the storage
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            recipe = json.loads(line)
+            validate_recipe(recipe)
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            raise ValueError(f"Line {number}: {error}")
+        yield recipe
+
+
+def validate_recipe(recipe):
+    # everything import_chunk() reads, so that a bad line is reported instead of failing the insert
+    if not isinstance(recipe, dict):
+        raise ValueError("a recipe must be an object")
+    for field in ("title", "description", "image"):
+        if not is_text(recipe.get(field)):
+            raise ValueError(f"{field} is required")
+    if recipe.get("tags") is not None and not isinstance(recipe["tags"], str):
+        raise ValueError("tags must be a string")
+    if recipe.get("created_date"):
+        if not isinstance(recipe["created_date"], str):
+            raise ValueError("created_date must be a string")
+        datetime.datetime.strptime(recipe["created_date"], Recipe.datetime_format)
+    for field in ("ingredients", "recipe_parts"):
+        if not isinstance(recipe.get(field) or [], list) or \
+                not all(isinstance(item, dict) for item in recipe.get(field) or []):
+            raise ValueError(f"{field} must be a list of objects")
+    for ingredient in recipe.get("ingredients") or []:
+        if not is_text(ingredient.get("name")):
+            raise ValueError("ingredient name is required")
+        amount = ingredient.get("amount")
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+            raise ValueError(f"amount of {ingredient['name']} must be a number")
+        parse_unit(ingredient.get("unit"))
+    for part in recipe.get("recipe_parts") or []:
+        if not is_text(part.get("text")):
+            raise ValueError("recipe part text is required")
+    for image in [recipe["image"]] + [part.get("image") for part in recipe.get("recipe_parts") or []]:
+        if image and (not isinstance(image, str) or not image.startswith(storage.folder)):
+            raise ValueError(f"image {image} is not in the storage")
+
+
+def is_text(value) -> bool:
+    return isinstance(value, str) and bool(value.strip())
+
+
+def export_recipes(user_id: int = None):
+    for recipe in db.iter_recipes(user_id=user_id):
+        yield json.dumps(recipe, ensure_ascii=False) + "\n"
+
+
+def get_recipes(tags: str = None, title: str = None, user_id: int = None, page: int = 1, cursor: str = None,
+                pages_info: bool = False):
+    recipes, pages, next_cursor = db.get_recipes(tags=tags, title=title, user_id=user_id, page=page,
+                                                 cursor=cursor, pages_info=pages_info)
+    return recipes_response(recipes, pages, next_cursor, pages_info)
+
+
+def recipes_response(recipes: list, pages: int, next_cursor: str, pages_info: bool = False):
+    if not recipes:
+        recipes = []
+
+    response = {"recipes": recipes, "next_cursor": next_cursor}
+    if pages_info:
+        response["pages"] = pages
+    return response
+
+
+def get_recipe(recipe_id: int):
+    recipe = db.get_recipe_by_id(recipe_id=recipe_id)
+    return recipe if recipe else {"error": "404 Not Found"}
+
+
+def delete_recipe(recipe_id: int, user_id: int, admin: bool = False):
+    recipe = db.get_recipe_by_id(recipe_id)
+    if not recipe:
+        return {"error": "404 Not Found"}
+    elif int(user_id) != recipe.get("user").get("id") and not admin:
+        return {"error": "403 Forbidden"}
+    else:
+        db.delete_recipe(recipe_id)
+        return {"success": "OK", "id": recipe_id}
+
+
+def get_recipe_version(recipe_id: int):
+    return recipe_version_response(recipe_id, db.get_recipe_version(recipe_id))
+
+
+def recipe_version_response(recipe_id: int, version: tuple):
+    if not version:
+        return None
+    return {"version": [recipe_id, version[0]], "last_modified": version[1]}
+
+
+def get_list_version(*names: str):
+    return list_version_response(names, db.get_data_versions(*names))
+
+
+def list_version_response(names: tuple, versions: dict):
+    return {"version": [versions.get(name, (0,))[0] for name in names],
+            "last_modified": max((updated for _, updated in versions.values() if updated), default=None)}
+
+
+def create_upload():
+    return storage.create_upload()
+
+
+def get_tags():
+    return {"tags": db.get_tags()}
+
+
+def get_cache_stats(admin: bool = False):
+    if not admin:
+        return {"error": "403 Forbidden"}
+    return db.cache_stats()
+
+
+def get_profiles(admin: bool = False):
+    if not admin:
+        return {"error": "403 Forbidden"}
+    return {"profiles": profiler.list(), "sample_rate": profiler.sample_rate, "format": profiler.format}
+
+
+def get_users(page: int = 1, cursor: str = None, pages_info: bool = False):
+    users, pages, next_cursor = db.get_users(page=page, cursor=cursor, pages_info=pages_info)
+    return users_response(users, pages, next_cursor, pages_info)
+
+
+def users_response(users: list, pages: int, next_cursor: str, pages_info: bool = False):
+    if not users:
+        users = []
+    response = {"users": users, "next_cursor": next_cursor}
+
+    if pages_info:
+        response["pages"] = pages
+    return response
+
+
+def get_user(user_id: int):
+    user = db.get_user_by_id(user_id=user_id)
+    return user if user else {"error": "404 Not Found"}
+
+
+def save_image(source, upload_key: str = None):
+    # only the upload is checked here, resizing and re-encoding run in the image pipeline
+    if upload_key:
+        return storage.save_upload(upload_key)
+    return storage.save(source if hasattr(source, "read") else BytesIO(decode_base64(source)))
+
+
+def decode_base64(b64text):
+    try:
+        return base64.b64decode(b64text)
+    except Exception as _:
+        raise Exception("Invalid Image File")
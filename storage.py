@@ -0,0 +1,281 @@
+import datetime
+import glob
+import hashlib
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from flask import url_for, g
+
+import images
+
+CHUNK_SIZE = 64 * 1024
+# a blob reused or written this recently may belong to a recipe that is not committed yet
+RECENT = 300
+PLACEHOLDER = "static/img/placeholder.svg"
+
+
+def static_url(path: str) -> str:
+    return url_for("static", filename=path.split("static/")[1])
+
+
+class LocalStorage:
+    # Keys are the paths stored in Recipe.image and RecipePart.image, e.g. static/uploads/ab/cd/<sha256>.jpg.
+    # The image pipeline always works on local files; publish() moves its output to where the keys live.
+    def __init__(self, folder: str = "static/uploads/", max_bytes: int = 0, max_pixels: int = images.MAX_PIXELS):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.lock = threading.Lock()
+
+    def key(self, digest: str) -> str:
+        return os.path.join(self.folder, digest[:2], digest[2:4], f"{digest}.jpg")
+
+    def local_path(self, key: str) -> str:
+        return key
+
+    @staticmethod
+    def blob_key(key: str) -> str:
+        # every file of a blob (upload, JPEG, variants, temporary files) maps back to its JPEG key
+        root = os.path.splitext(key[:-len(".tmp")] if key.endswith(".tmp") else key)[0]
+        for variant in images.VARIANTS:
+            if root.endswith(f"_{variant}"):
+                root = root[:-len(variant) - 1]
+        return f"{root}.jpg"
+
+    @staticmethod
+    def files(key: str):
+        return [key] + [images.variant_path(key, variant) for variant in images.VARIANTS]
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(key)
+
+    def touch(self, key: str):
+        os.utime(key)
+
+    def age(self, key: str):
+        try:
+            return time.time() - os.path.getmtime(key)
+        except FileNotFoundError:
+            return None
+
+    def list(self):
+        now = time.time()
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                key = os.path.join(root, name)
+                yield key, now - os.path.getmtime(key)
+
+    def delete(self, keys):
+        for key in keys:
+            try:
+                os.remove(key)
+            except FileNotFoundError:
+                pass
+
+    def publish(self, key: str):
+        pass
+
+    def save(self, source) -> str:
+        work = self.local_path(self.folder)
+        os.makedirs(work, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=work, suffix=".tmp")
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, "wb") as file:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                size += len(chunk)
+                if self.max_bytes and size > self.max_bytes:
+                    file.close()
+                    os.remove(temp)
+                    raise ValueError(f"Image is too large: at most {self.max_bytes} bytes are allowed")
+                digest.update(chunk)
+                file.write(chunk)
+
+        key = self.key(digest.hexdigest())
+        upload = f"{os.path.splitext(self.local_path(key))[0]}.upload"
+        with self.lock:
+            if os.path.exists(upload) or self.exists(key):
+                os.remove(temp)
+                if os.path.exists(upload):
+                    os.utime(upload)
+                else:
+                    self.touch(key)
+                return key
+            try:
+                images.validate(temp, self.max_pixels)
+            except Exception:
+                os.remove(temp)
+                raise
+            os.makedirs(os.path.dirname(upload), exist_ok=True)
+            os.replace(temp, upload)
+        images.pipeline.submit(upload, self.local_path(key), callback=lambda _: self.publish(key))
+        return key
+
+    def process_pending(self):
+        # uploads left behind by a process that stopped before its pipeline finished
+        work = self.local_path(self.folder)
+        count = 0
+        for upload in glob.glob(os.path.join(work, "**", "*.upload"), recursive=True):
+            target = f"{os.path.splitext(upload)[0]}.jpg"
+            images.process(upload, target)
+            self.publish(os.path.join(self.folder, os.path.relpath(target, work)))
+            count += 1
+        return count
+
+    def release(self, keys):
+        for key in keys:
+            if not key or self.blob_key(key) != key or not key.startswith(self.folder):
+                continue
+            age = self.age(key)
+            if age is None or age < RECENT:
+                continue
+            self.delete(self.files(key))
+
+    def collect_garbage(self, referenced, grace: float = 3600, dry_run: bool = False):
+        referenced = {os.path.normpath(key) for key in referenced if key}
+        removed = [key for key, age in self.list()
+                   if os.path.normpath(self.blob_key(key)) not in referenced and age >= grace]
+        if not dry_run:
+            self.delete(removed)
+        return removed
+
+    def create_upload(self):
+        raise ValueError("Direct uploads are not supported by the local storage")
+
+    def save_upload(self, upload_key: str) -> str:
+        raise ValueError("Direct uploads are not supported by the local storage")
+
+    def image_url(self, key: str, variant: str = None) -> str:
+        if variant and self.exists(images.variant_path(key, variant)):
+            return static_url(images.variant_path(key, variant))
+        if self.exists(key):
+            return static_url(key)
+        # still being processed; the page must not be cached with the placeholder in it
+        g.image_placeholder = True
+        return static_url(PLACEHOLDER)
+
+    def image_srcset(self, key: str) -> str:
+        return ", ".join(f"{static_url(images.variant_path(key, variant))} {width}w"
+                         for variant, (width, _) in reversed(images.VARIANTS.items())
+                         if self.exists(images.variant_path(key, variant)))
+
+    def redirect_url(self, key: str, variant: str = None) -> str:
+        return self.image_url(key, variant)
+
+
+class S3Storage(LocalStorage):
+    # Objects are stored under their keys in the bucket; the pipeline works in a local scratch folder and
+    # publish() uploads its output. Pages link to /images/<key>, which redirects to a presigned URL.
+    def __init__(self, bucket: str, folder: str = "static/uploads/", client=None, endpoint_url: str = None,
+                 region: str = None, work_folder: str = None, url_expires: int = 3600, max_bytes: int = 0,
+                 max_pixels: int = images.MAX_PIXELS):
+        super().__init__(folder, max_bytes, max_pixels)
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.work_folder = work_folder or os.path.join(tempfile.gettempdir(), "cookbook-storage")
+        self.url_expires = url_expires
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.work_folder, key)
+
+    def head(self, key: str):
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self.head(key) is not None
+
+    def touch(self, key: str):
+        self.client.copy_object(Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": key},
+                                MetadataDirective="REPLACE", ContentType="image/jpeg",
+                                CacheControl="public, max-age=31536000, immutable")
+
+    def age(self, key: str):
+        head = self.head(key)
+        if head is None:
+            return None
+        return (datetime.datetime.now(datetime.timezone.utc) - head["LastModified"]).total_seconds()
+
+    def list(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.folder):
+            for item in page.get("Contents", []):
+                yield item["Key"], (now - item["LastModified"]).total_seconds()
+
+    def delete(self, keys):
+        keys = list(keys)
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                "Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True})
+
+    def publish(self, key: str):
+        # variants first: the JPEG marks the blob as complete
+        for file in reversed(self.files(key)):
+            path = self.local_path(file)
+            if os.path.exists(path):
+                self.client.upload_file(path, self.bucket, file, ExtraArgs={
+                    "ContentType": mimetypes.guess_type(file)[0] or "application/octet-stream",
+                    # content-addressed objects never change
+                    "CacheControl": "public, max-age=31536000, immutable"})
+                os.remove(path)
+
+    def create_upload(self):
+        key = os.path.join(self.folder, "incoming", str(uuid.uuid4()))
+        conditions = [["starts-with", "$Content-Type", "image/"]]
+        if self.max_bytes:
+            conditions.append(["content-length-range", 1, self.max_bytes])
+        post = self.client.generate_presigned_post(self.bucket, key, Conditions=conditions,
+                                                   ExpiresIn=self.url_expires)
+        return {"key": key, "url": post["url"], "fields": post["fields"]}
+
+    def save_upload(self, upload_key: str) -> str:
+        if not upload_key.startswith(os.path.join(self.folder, "incoming", "")):
+            raise ValueError("Invalid upload key")
+        from botocore.exceptions import ClientError
+
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=upload_key)["Body"]
+        except ClientError:
+            raise ValueError("Upload not found")
+        key = self.save(body)
+        self.delete([upload_key])
+        return key
+
+    def image_url(self, key: str, variant: str = None) -> str:
+        return url_for("pages.image", key=key, variant=variant)
+
+    def image_srcset(self, key: str) -> str:
+        return ", ".join(f"{url_for('pages.image', key=key, variant=variant)} {width}w"
+                         for variant, (width, _) in reversed(images.VARIANTS.items()))
+
+    def redirect_url(self, key: str, variant: str = None) -> str:
+        for candidate in ([images.variant_path(key, variant)] if variant else []) + [key]:
+            if self.exists(candidate):
+                return self.client.generate_presigned_url("get_object", ExpiresIn=self.url_expires,
+                                                          Params={"Bucket": self.bucket, "Key": candidate})
+        g.image_placeholder = True
+        return static_url(PLACEHOLDER)
+
+
+def create_storage(config):
+    if config.get("STORAGE_TYPE", "local") == "s3":
+        return S3Storage(config["S3_BUCKET"], folder=config["UPLOAD_FOLDER"],
+                         endpoint_url=config.get("S3_ENDPOINT_URL"), region=config.get("S3_REGION"),
+                         url_expires=config.get("S3_URL_EXPIRES", 3600), max_bytes=config.get("IMAGE_MAX_BYTES", 0),
+                         max_pixels=config.get("IMAGE_MAX_PIXELS", images.MAX_PIXELS))
+    return LocalStorage(config["UPLOAD_FOLDER"], max_bytes=config.get("IMAGE_MAX_BYTES", 0),
+                        max_pixels=config.get("IMAGE_MAX_PIXELS", images.MAX_PIXELS))
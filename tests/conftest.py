@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = "test-password"
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    from main import create_app
+
+    database = tmp_path_factory.mktemp("db") / "db.sqlite"
+    app = create_app({"DATABASE_URL": f"sqlite:///{database}", "CACHE_TYPE": "none",
+                      "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1", "TESTING": True})
+    yield app
+
+
+@pytest.fixture(scope="module")
+def user_id(app):
+    # the "test" user with 50 recipes of five ingredients and five steps each
+    import services
+
+    user_id = services.db.create_user("test", PASSWORD)
+    for i in range(50):
+        services.db.create_recipe(title=f"Рецепт {i}", description=f"Описание {i}", user_id=user_id,
+                                  tags=f"тег{i % 3}, тег{i % 2}", image="static/uploads/test.jpg",
+                                  ingredients=[{"name": f"ингредиент {j}", "amount": 100, "unit": "GRAM"}
+                                               for j in range(5)],
+                                  recipe_parts=[{"text": f"Шаг {j}"} for j in range(5)])
+    return user_id
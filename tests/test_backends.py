@@ -0,0 +1,103 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+import sqlalchemy.exc
+
+from db import db_session
+from db.db_operations import DatabaseOperations
+
+POSTGRES = os.environ.get("TEST_DATABASE_URL") or (shutil.which("initdb") and shutil.which("pg_ctl"))
+
+
+@pytest.fixture(scope="module")
+def postgres(tmp_path_factory):
+    # TEST_DATABASE_URL, or a throwaway local cluster
+    if os.environ.get("TEST_DATABASE_URL"):
+        yield os.environ["TEST_DATABASE_URL"]
+        return
+    workdir = tmp_path_factory.mktemp("postgres")
+    data = workdir / "pgdata"
+    subprocess.run(["initdb", "-D", data, "-U", "postgres", "-A", "trust", "-E", "UTF8"],
+                   check=True, capture_output=True)
+    subprocess.run(["pg_ctl", "-D", data, "-o", f"-k {workdir} -p 54329 -c listen_addresses=''",
+                    "-l", workdir / "pg.log", "-w", "start"], check=True, capture_output=True)
+    yield f"postgresql+psycopg2://postgres@/postgres?host={workdir}&port=54329"
+    subprocess.run(["pg_ctl", "-D", data, "-m", "immediate", "stop"], capture_output=True)
+
+
+@pytest.fixture(scope="module", params=[
+    "sqlite",
+    pytest.param("postgresql", marks=pytest.mark.skipif(not POSTGRES,
+                                                        reason="set TEST_DATABASE_URL or install initdb/pg_ctl")),
+])
+def db(request, tmp_path_factory):
+    if request.param == "sqlite":
+        database = f"sqlite:///{tmp_path_factory.mktemp('sqlite') / 'db.sqlite'}"
+    else:
+        database = request.getfixturevalue("postgres")
+    engine = db_session.create_engine(database)
+    db_session.SqlAlchemyBase.metadata.drop_all(engine)
+    engine.dispose()
+
+    db = DatabaseOperations(database)
+    alice = db.create_user("alice", "alice-password", "about alice")
+    bob = db.create_user("bob", "bob-password")
+    for i in range(25):
+        db.create_recipe(title=f"Суп {i}" if i % 2 else f"Пирог {i}", description="Описание", user_id=alice,
+                         tags="суп, обед" if i % 2 else "выпечка, соль", image="static/uploads/x.jpg",
+                         ingredients=[{"name": "вода", "amount": 1.5, "unit": "LITER"}],
+                         recipe_parts=[{"text": "Шаг 1"}, {"text": "Шаг 2", "image": "static/uploads/y.jpg"}])
+    db.create_recipe(title="Фасоль", description="Описание", user_id=bob, tags="фасоль")
+    return db
+
+
+def test_users(db):
+    with pytest.raises(sqlalchemy.exc.IntegrityError):
+        db.create_user("alice", "other-password")
+    assert db.check_user_password("alice", "alice-password")
+    assert not db.check_user_password("alice", "wrong")
+    bob = db.get_user_by_username("bob")
+    assert bob == {"id": bob["id"], "username": "bob", "about": None, "admin": False}
+    users, pages, _ = db.get_users(pages_info=True)
+    assert [u["username"] for u in users] == ["alice", "bob"] and pages == 1
+
+
+def test_filters(db):
+    recipes, pages, _ = db.get_recipes(tags="соль", pages_info=True)
+    assert pages == 2 and all("соль" in r["tags"] for r in recipes)
+    recipes, _, _ = db.get_recipes(tags="суп, обед", title="Суп")
+    assert len(recipes) == 10 and all(r["title"].startswith("Суп") for r in recipes)
+
+
+def test_keyset_pagination(db):
+    paged = []
+    for page in range(1, 4):
+        paged += [r["id"] for r in db.get_recipes(page=page)[0]]
+    keyset, cursor = [], None
+    while True:
+        recipes, _, cursor = db.get_recipes(cursor=cursor)
+        keyset += [r["id"] for r in recipes]
+        if not cursor:
+            break
+    assert paged == keyset and len(keyset) == 26
+
+
+def test_recipe(db):
+    newest, second = [r["id"] for r in db.get_recipes()[0][:2]]
+    recipe = db.get_recipe_by_id(newest)
+    assert recipe["user"] == {"id": db.get_user_by_username("bob")["id"], "username": "bob"}
+    recipe = db.get_recipe_by_id(second)
+    assert recipe["ingredients"] == [{"name": "вода", "amount": 1.5, "unit": "л"}]
+    assert [p["text"] for p in recipe["recipe_parts"]] == ["Шаг 1", "Шаг 2"]
+
+
+def test_update_and_delete(db):
+    recipe_id = db.get_recipes(title="Фасоль")[0][0]["id"]
+    db.update_recipe(recipe_id, title="Фасоль тушеная", tags="фасоль, ужин")
+    assert db.get_recipe_by_id(recipe_id)["title"] == "Фасоль тушеная"
+    assert {"name": "ужин", "count": 1} in db.get_tags()
+    db.delete_recipe(recipe_id)
+    assert db.get_recipe_by_id(recipe_id) is None
+    assert all(tag["name"] not in ("фасоль", "ужин") for tag in db.get_tags())
@@ -0,0 +1,57 @@
+import pytest
+
+from db import db_session
+from db.db_operations import DatabaseOperations
+
+# the statements one request runs with the cache off; the recipe lists start with the data versions
+# their cache keys are built on, a recipe page with the version of that recipe
+REQUESTS = [
+    ("/api/recipes", 2),
+    ("/api/recipes?pages_info=1", 3),
+    ("/api/recipes?title=рецепт&tags=тег1,тег2&pages_info=1", 3),
+    ("/api/recipes?user_id=1&page=3", 2),
+    ("/api/recipes/5", 4),
+    ("/api/users?pages_info=1", 2),
+    ("/api/users/1", 1),
+    ("/api/tags", 1),
+    ("/", 3),
+    ("/recipes/5", 4),
+    ("/users/1", 4),
+    ("/search?title=рецепт", 3),
+]
+
+CALLS = [
+    ("get_recipes", {}, 1),
+    ("get_recipes", {"pages_info": True}, 2),
+    ("get_recipes", {"title": "рецепт", "tags": "тег1, тег2", "pages_info": True}, 2),
+    ("get_recipes", {"user_id": 1, "page": 3}, 1),
+    ("get_recipe_by_id", {"recipe_id": 5}, 3),
+    ("get_user_by_id", {"user_id": 1}, 1),
+    ("get_user_by_username", {"username": "test"}, 1),
+    ("get_user_credentials", {"username": "test"}, 1),
+    ("get_users", {"pages_info": True}, 2),
+    ("get_recipe_version", {"recipe_id": 5}, 1),
+    ("get_data_versions", {}, 1),
+]
+
+
+@pytest.fixture
+def statements():
+    statements = []
+    listener = lambda statement, seconds: statements.append(statement)
+    db_session.query_listeners.append(listener)
+    yield statements
+    db_session.query_listeners.remove(listener)
+
+
+@pytest.mark.parametrize("url, expected", REQUESTS)
+def test_request(app, user_id, statements, url, expected):
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    assert len(statements) == expected, statements
+
+
+@pytest.mark.parametrize("method, kwargs, expected", CALLS)
+def test_call(app, user_id, statements, method, kwargs, expected):
+    getattr(DatabaseOperations(), method)(**kwargs)
+    assert len(statements) == expected, statements
@@ -0,0 +1,94 @@
+import io
+import os
+
+import pytest
+
+import images
+import storage as storage_module
+from storage import LocalStorage, S3Storage
+
+try:
+    from moto.server import ThreadedMotoServer
+except ImportError:
+    ThreadedMotoServer = None
+
+S3 = os.environ.get("TEST_S3_ENDPOINT") or ThreadedMotoServer
+
+
+def jpeg(color: str) -> bytes:
+    from PIL import Image
+
+    data = io.BytesIO()
+    Image.new("RGB", (1200, 800), color).save(data, "JPEG")
+    return data.getvalue()
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    # TEST_S3_ENDPOINT (e.g. a local MinIO), or moto's server mode
+    if os.environ.get("TEST_S3_ENDPOINT"):
+        yield os.environ["TEST_S3_ENDPOINT"]
+        return
+    server = ThreadedMotoServer(port=5079)
+    server.start()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", os.environ.get("AWS_ACCESS_KEY_ID", "testing"))
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", os.environ.get("AWS_SECRET_ACCESS_KEY", "testing"))
+        yield "http://127.0.0.1:5079"
+    server.stop()
+
+
+@pytest.fixture(params=[
+    "local",
+    pytest.param("s3", marks=pytest.mark.skipif(not S3, reason="set TEST_S3_ENDPOINT or install moto[server]")),
+])
+def storage(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage_module, "RECENT", 0)
+    if request.param == "local":
+        return LocalStorage("static/uploads/")
+    endpoint = request.getfixturevalue("s3_endpoint")
+    s3 = S3Storage(os.environ.get("TEST_S3_BUCKET", "cookbook-test"), endpoint_url=endpoint, region="us-east-1",
+                   work_folder=str(tmp_path / "work"))
+    try:
+        s3.client.create_bucket(Bucket=s3.bucket)
+    except s3.client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    s3.delete(key for key, _ in s3.list())
+    return s3
+
+
+def test_save(storage):
+    red = storage.save(io.BytesIO(jpeg("red")))
+    assert storage.save(io.BytesIO(jpeg("red"))) == red
+    assert storage.save(io.BytesIO(jpeg("blue"))) != red
+    with pytest.raises(Exception, match="Invalid Image File"):
+        storage.save(io.BytesIO(b"not an image"))
+    images.pipeline.wait()
+    assert all(storage.exists(file) for file in storage.files(red))
+
+
+def test_release_and_collect_garbage(storage):
+    red = storage.save(io.BytesIO(jpeg("red")))
+    blue = storage.save(io.BytesIO(jpeg("blue")))
+    images.pipeline.wait()
+    storage.release([blue])
+    assert not any(storage.exists(file) for file in storage.files(blue))
+    assert storage.exists(red)
+    assert storage.collect_garbage([red], grace=0) == []
+    assert len(storage.collect_garbage([], grace=0, dry_run=True)) == len(storage.files(red))
+
+
+def test_direct_upload(storage):
+    import requests
+
+    try:
+        upload = storage.create_upload()
+    except ValueError:
+        pytest.skip("direct uploads not supported")
+    response = requests.post(upload["url"], data={**upload["fields"], "Content-Type": "image/jpeg"},
+                             files={"file": ("green.jpg", jpeg("green"), "image/jpeg")})
+    assert response.status_code in (200, 204)
+    green = storage.save_upload(upload["key"])
+    images.pipeline.wait()
+    assert storage.exists(green) and not storage.exists(upload["key"])
@@ -0,0 +1,4 @@
+from main import create_app
+
+# Entry point for WSGI servers, e.g. `gunicorn wsgi:application` (settings in gunicorn.conf.py)
+application = create_app()